@@ -0,0 +1,61 @@
+"""The real FastAPI app (server/main.py), wired up for offline load tests.
+
+Runs with the in-memory storage backend and a FakeModel in place of the
+Anthropic API, and adds one route the OAuth flow can't provide offline:
+
+    POST /bench/login {"google_id", "email", "name"} -> {"access_token"}
+
+which does what the OAuth callback does once Google has answered. Started
+by load_test.py; not meant to be run on its own.
+"""
+import argparse
+import os
+import sys
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+sys.path.insert(0, SERVER_DIR)
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("GOOGLE_CLIENT_ID", "bench")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "bench")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from anthropic import AsyncAnthropic  # noqa: E402
+
+from fake_anthropic import FakeModel  # noqa: E402
+
+
+def build_app(fake: FakeModel):
+    import api.chat
+    from auth import create_access_token, get_or_create_user
+    from main import app
+    from models import get_db
+
+    api.chat.client = AsyncAnthropic(api_key="fake", http_client=httpx.AsyncClient(transport=fake.async_transport()))
+
+    @app.post("/bench/login", include_in_schema=False)
+    async def bench_login(user_info: dict):
+        user = await get_or_create_user(
+            {"sub": user_info["google_id"], "email": user_info["email"], "name": user_info["name"]},
+            get_db(),
+        )
+        return {"access_token": create_access_token({"sub": str(user.id)})}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    fake = FakeModel(tokens=args.tokens, token_interval=args.token_interval, first_token_latency=args.first_token_latency)
+    uvicorn.run(build_app(fake), host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Fake Anthropic Messages API that streams SSE replies at a configurable rate.
+
+Plugs into the real SDK clients through an httpx transport, so benchmarks
+exercise the same streaming code paths as production without network access
+or API spend:
+
+    fake = FakeModel(tokens=50, token_interval=0.02)
+    client = AsyncAnthropic(api_key="fake", http_client=httpx.AsyncClient(transport=fake.async_transport()))
+"""
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+@dataclass
+class FakeModel:
+    tokens: int = 50
+    token_interval: float = 0.02
+    first_token_latency: float = 0.2
+    token_text: str = "lorem "
+    input_tokens: int = 25
+    # Streams currently being served and the most seen at once
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _prologue(self, model: str) -> list:
+        return [
+            _sse("message_start", {
+                "type": "message_start",
+                "message": {
+                    "id": "msg_fake", "type": "message", "role": "assistant", "model": model,
+                    "content": [], "stop_reason": None, "stop_sequence": None,
+                    "usage": {"input_tokens": self.input_tokens, "output_tokens": 1},
+                },
+            }),
+            _sse("content_block_start", {
+                "type": "content_block_start", "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            }),
+        ]
+
+    def _delta(self) -> bytes:
+        return _sse("content_block_delta", {
+            "type": "content_block_delta", "index": 0,
+            "delta": {"type": "text_delta", "text": self.token_text},
+        })
+
+    def _epilogue(self) -> list:
+        return [
+            _sse("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            _sse("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": self.tokens},
+            }),
+            _sse("message_stop", {"type": "message_stop"}),
+        ]
+
+    def _sync_body(self, model: str):
+        self._enter()
+        try:
+            yield from self._prologue(model)
+            time.sleep(self.first_token_latency)
+            for i in range(self.tokens):
+                if i:
+                    time.sleep(self.token_interval)
+                yield self._delta()
+            yield from self._epilogue()
+        finally:
+            self._exit()
+
+    async def _async_body(self, model: str):
+        self._enter()
+        try:
+            for chunk in self._prologue(model):
+                yield chunk
+            await asyncio.sleep(self.first_token_latency)
+            for i in range(self.tokens):
+                if i:
+                    await asyncio.sleep(self.token_interval)
+                yield self._delta()
+            for chunk in self._epilogue():
+                yield chunk
+        finally:
+            self._exit()
+
+    def sync_transport(self) -> httpx.MockTransport:
+        def handler(request: httpx.Request) -> httpx.Response:
+            model = json.loads(request.content).get("model", "fake")
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=self._sync_body(model))
+
+        return httpx.MockTransport(handler)
+
+    def async_transport(self) -> httpx.MockTransport:
+        async def handler(request: httpx.Request) -> httpx.Response:
+            model = json.loads(await request.aread()).get("model", "fake")
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=self._async_body(model))
+
+        return httpx.MockTransport(handler)
@@ -0,0 +1,132 @@
+"""ID collisions and write hotspots: microsecond-timestamp ids vs snowflake ids with salted keys.
+
+This is a simulation standing in for a write-throughput benchmark: no
+rows are written anywhere. Hotspotting only limits throughput on a real
+Bigtable cluster, where one tablet (one node) takes every write whose key
+falls in its range; the emulator and the in-memory backend have a single
+range, so sequential and salted keys write equally fast there and a timed
+run against them can't show the difference. The tablet share below is the
+figure that bounds throughput instead: a key scheme whose busiest tablet
+takes share s of new rows can sustain at most about 1/s nodes' worth of
+write throughput. Confirming that as writes per second needs a cluster
+with enough data to have split.
+
+Two parts, both offline:
+
+- IDs: THREADS threads (standing in for concurrent requests) each take
+  --ids ids, once with int(time.time() * 1000000) as create_user and
+  create_message used to, and once from server/ids.py, plus the same from
+  --workers separate generators standing in for worker processes. Reports
+  ids per second and how many ids were handed out more than once (each one
+  an overwritten row).
+
+- Tablets (simulated): a table of --existing users is split into --tablets tablets at
+  key quantiles, the way Bigtable splits by size, and --new signups are
+  written. Reports the share of writes landing on the busiest tablet. With
+  time-ordered user#{id} keys every new row sorts after every existing one,
+  so all writes go to the last tablet; salted user#{salt}#{id} keys spread
+  them across the table.
+
+    uv run python benchmarks/key_hotspots.py
+    uv run python benchmarks/key_hotspots.py --threads 16 --tablets 32
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+from ids import MAX_WORKER_ID, IdGenerator  # noqa: E402
+from models.bigtable_user import legacy_user_row_key, user_row_key  # noqa: E402
+
+
+def timestamp_id() -> int:
+    return int(time.time() * 1000000)
+
+
+def take_ids(sources: List[Callable[[], int]], threads: int, per_thread: int) -> dict:
+    """Draw ids from several threads at once; thread i uses sources[i % len(sources)]"""
+    results: List[List[int]] = [[] for _ in range(threads)]
+    start = threading.Barrier(threads + 1)
+
+    def worker(i: int):
+        source = sources[i % len(sources)]
+        start.wait()
+        results[i] = [source() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ids = [id_ for batch in results for id_ in batch]
+    return {
+        "ids": len(ids),
+        "ids_per_second": round(len(ids) / elapsed),
+        "duplicates": len(ids) - len(set(ids)),
+        "max_id_below_2_53": max(ids) < 2**53,
+    }
+
+
+def tablet_spread(existing_keys: List[str], new_keys: List[str], tablets: int) -> dict:
+    """Share of new_keys written to each tablet of a table split evenly over existing_keys"""
+    ordered = sorted(existing_keys)
+    splits = [ordered[len(ordered) * i // tablets] for i in range(1, tablets)]
+    writes = Counter(bisect.bisect_right(splits, key) for key in new_keys)
+    busiest = max(writes.values())
+    return {
+        "tablets_written": len(writes),
+        "busiest_tablet_share": round(busiest / len(new_keys), 3),
+        "ideal_share": round(1 / tablets, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ids", type=int, default=50000, help="ids per thread")
+    parser.add_argument("--workers", type=int, default=4, help="generators standing in for worker processes")
+    parser.add_argument("--existing", type=int, default=100000, help="users already in the table")
+    parser.add_argument("--new", type=int, default=10000, help="signups written after the split")
+    parser.add_argument("--tablets", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    generators = [IdGenerator(worker_id=i % (MAX_WORKER_ID + 1)) for i in range(args.workers)]
+    ids = {
+        "timestamp": take_ids([timestamp_id], args.threads, args.ids),
+        "snowflake": take_ids([generators[0].next_id], args.threads, args.ids),
+        f"snowflake_{args.workers}_workers": take_ids([g.next_id for g in generators], args.threads, args.ids),
+    }
+
+    # Users who signed up over the past year, then a burst of new signups
+    rng = random.Random(args.seed)
+    now_us = timestamp_id()
+    old_ids = [now_us - rng.randrange(365 * 24 * 3600 * 1000000) for _ in range(args.existing)]
+    generator = IdGenerator(worker_id=0)
+    new_ids = [generator.next_id() for _ in range(args.new)]
+    tablets = {
+        "timestamp_keys": tablet_spread(
+            [legacy_user_row_key(i) for i in old_ids], [legacy_user_row_key(i) for i in new_ids], args.tablets,
+        ),
+        "salted_keys": tablet_spread(
+            [user_row_key(i) for i in old_ids], [user_row_key(i) for i in new_ids], args.tablets,
+        ),
+    }
+
+    print(json.dumps({"ids": ids, "tablets": tablets}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""End-to-end load test of the API with simulated users and a fake model.
+
+Starts server/main.py in a subprocess (bench_server.py: in-memory storage,
+FakeModel instead of Anthropic) and drives it over HTTP with N concurrent
+users. Each user logs in, lists their chats, then repeatedly opens a chat
+and sends several turns, reading each streamed reply to the end.
+
+Reports p50/p95/p99 latency per operation, time to first token, throughput,
+and server memory per concurrent stream, and saves it all as JSON so runs
+can be compared between commits:
+
+    uv run python benchmarks/load_test.py --users 200 --output before.json
+    uv run python benchmarks/load_test.py --users 200 --output after.json
+    uv run python benchmarks/load_test.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": _ms(percentile(samples, 50)),
+        "p95_ms": _ms(percentile(samples, 95)),
+        "p99_ms": _ms(percentile(samples, 99)),
+        "max_ms": _ms(max(samples) if samples else None),
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process, from /proc (None where that isn't available)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """Latency samples per operation, plus stream counts for the memory estimate"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.ttft: List[float] = []
+        self.output_frames = 0
+        self.streams_open = 0
+        self.peak_streams_open = 0
+
+    async def timed(self, name: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            response.raise_for_status()
+            return response
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+
+
+async def send_turn(http: httpx.AsyncClient, recorder: Recorder, chat_id: str, message: str):
+    """POST one message and read the NDJSON reply to the end"""
+    started = time.perf_counter()
+    first_token_at = None
+    recorder.streams_open += 1
+    recorder.peak_streams_open = max(recorder.peak_streams_open, recorder.streams_open)
+    try:
+        async with http.stream("POST", f"/chats/{chat_id}", json={"message": message}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                frame = json.loads(line)
+                if frame["type"] == "content":
+                    recorder.output_frames += 1
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                elif frame["type"] == "error":
+                    raise httpx.HTTPError(frame.get("detail", "error frame"))
+    except httpx.HTTPError:
+        recorder.errors["send"] += 1
+        return
+    finally:
+        recorder.streams_open -= 1
+
+    recorder.latencies["send"].append(time.perf_counter() - started)
+    if first_token_at is not None:
+        recorder.ttft.append(first_token_at - started)
+
+
+async def simulate_user(base_url: str, recorder: Recorder, user: int, chats: int, turns: int, think_time: float):
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+        response = await recorder.timed("login", http.post("/bench/login", json={
+            "google_id": f"bench-{user}", "email": f"bench-{user}@example.com", "name": f"Bench User {user}",
+        }))
+        if response is None:
+            return
+        http.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        await recorder.timed("me", http.get("/auth/me"))
+        await recorder.timed("list_chats", http.get("/chats"))
+
+        for _ in range(chats):
+            chat_id = str(uuid.uuid4())
+            for turn in range(turns):
+                if turn:
+                    # Reopen the chat the way the client does before continuing it
+                    await recorder.timed("open_chat", http.get(f"/chats/{chat_id}"))
+                await send_turn(http, recorder, chat_id, f"Message {turn} from user {user}")
+                if think_time:
+                    await asyncio.sleep(think_time)
+            await recorder.timed("list_chats", http.get("/chats"))
+
+
+async def sample_rss(pid: int, samples: List[int], stop: asyncio.Event):
+    while not stop.is_set():
+        rss = _rss_bytes(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.05)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("bench server exited during startup")
+            try:
+                if (await http.get("/metrics")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("bench server did not start")
+
+
+async def run(args) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "bench_server.py"),
+        "--port", str(port),
+        "--tokens", str(args.tokens),
+        "--token-interval", str(args.token_interval),
+        "--first-token-latency", str(args.first_token_latency),
+    ])
+    try:
+        await wait_until_ready(base_url, process)
+        baseline_rss = _rss_bytes(process.pid)
+
+        recorder = Recorder()
+        rss_samples: List[int] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(process.pid, rss_samples, stop))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            simulate_user(base_url, recorder, user, args.chats, args.turns, args.think_time)
+            for user in range(args.users)
+        ))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await sampler
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    requests = sum(len(samples) for samples in recorder.latencies.values())
+    peak_rss = max(rss_samples) if rss_samples else None
+    memory = {"baseline_rss_bytes": baseline_rss, "peak_rss_bytes": peak_rss, "bytes_per_concurrent_stream": None}
+    if baseline_rss and peak_rss and recorder.peak_streams_open:
+        memory["bytes_per_concurrent_stream"] = round((peak_rss - baseline_rss) / recorder.peak_streams_open)
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users,
+            "chats_per_user": args.chats,
+            "turns_per_chat": args.turns,
+            "think_time": args.think_time,
+            "tokens": args.tokens,
+            "token_interval": args.token_interval,
+            "first_token_latency": args.first_token_latency,
+        },
+        "wall_seconds": round(elapsed, 3),
+        "throughput": {
+            "requests_per_second": round(requests / elapsed, 1),
+            "turns_per_second": round(len(recorder.latencies["send"]) / elapsed, 1),
+            "output_frames_per_second": round(recorder.output_frames / elapsed, 1),
+        },
+        "latency": {name: summarize(samples) for name, samples in sorted(recorder.latencies.items())},
+        "time_to_first_token": summarize(recorder.ttft),
+        "peak_concurrent_streams": recorder.peak_streams_open,
+        "memory": memory,
+        "errors": dict(recorder.errors),
+    }
+
+
+def compare(before_path: str, after_path: str):
+    """Print the change in each numeric result between two saved runs"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def walk(a, b, path=""):
+        for key in sorted(set(a) | set(b)):
+            old, new = a.get(key), b.get(key)
+            name = f"{path}.{key}" if path else key
+            if isinstance(old, dict) and isinstance(new, dict):
+                walk(old, new, name)
+            elif isinstance(old, (int, float)) and isinstance(new, (int, float)) and not isinstance(old, bool):
+                change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+                print(f"{name:55} {old:>14} {new:>14} {change:>9}")
+
+    print(f"{'':55} {before.get('commit') or 'before':>14} {after.get('commit') or 'after':>14}")
+    walk(before, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=2, help="chats per user")
+    parser.add_argument("--turns", type=int, default=3, help="turns per chat")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a user's turns")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per fake reply")
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="write the results JSON here as well as to stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two saved results and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Storage bytes and decode latency of packed message cells, with and without zstd.
+
+Encodes chat transcripts the way AsyncBigtableChatService writes them
+(pack_message) and decodes full histories the way it reads them
+(unpack_message), once with content compression disabled and once at the
+configured threshold. Reports cell bytes per history, the bytes a full
+history read moves at a given link speed, and p50/p95 encode and decode
+time per history.
+
+Transcripts are generated (prose, lists and code in the shape of real
+replies, with the occasional pasted log; drawn from a small phrase pool, so
+they compress somewhat better than real chats), or read from a JSONL file of
+{"messages": [{"role": "user" | "assistant", "content": "..."}]} lines:
+
+    uv run python benchmarks/message_compression.py --chats 200
+    uv run python benchmarks/message_compression.py --input transcripts.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+from models import bigtable_chat  # noqa: E402
+from models.bigtable_chat import message_row_key, pack_message, unpack_message  # noqa: E402
+from models.chat import ChatMessage  # noqa: E402
+
+TOPICS = ["the cache", "the request handler", "Bigtable", "the migration", "the streaming response",
+          "the OAuth callback", "pagination", "the chat index", "token usage", "the event loop"]
+SENTENCES = [
+    "The simplest fix is to move {topic} behind a single function so every caller goes through the same path.",
+    "{topic} is doing more work than it needs to on every request, mostly because nothing is reused between calls.",
+    "If you measure first, you will probably find that {topic} dominates the latency profile under load.",
+    "Keep in mind that {topic} runs on the event loop, so anything blocking there stalls every other request.",
+    "A common mistake is to read {topic} once per message instead of once per conversation.",
+    "You can verify the change by running the load test before and after and comparing p95 latency.",
+    "This keeps the behaviour identical for existing clients while making the common case much cheaper.",
+    "Here is a minimal version that you can adapt to your code:",
+]
+CODE = [
+    "```python\nasync def get_history(chat_id: str) -> list[Message]:\n"
+    "    rows = await table.read_rows(ReadRowsQuery(row_ranges=prefix_range(chat_id)))\n"
+    "    return [decode(row) for row in rows]\n```",
+    "```python\n@app.get(\"/chats/{chat_id}\")\nasync def get_chat(chat_id: str, user=Depends(current_user)):\n"
+    "    chat = await chats.get(chat_id)\n    if chat is None or chat.user_id != user.id:\n"
+    "        raise HTTPException(status_code=404, detail=\"Chat not found\")\n    return chat\n```",
+    "```bash\nuv run python benchmarks/load_test.py --users 200 --output after.json\n```",
+    "```typescript\nconst response = await fetch(`/api/chats/${chatId}`, { credentials: \"include\" });\n"
+    "if (!response.ok) throw new Error(`HTTP ${response.status}`);\nconst chat = await response.json();\n```",
+]
+QUESTIONS = [
+    "Why is {topic} slow when there are a lot of messages?",
+    "Can you explain how {topic} works and what I should change?",
+    "I'm seeing timeouts around {topic}, any ideas?",
+    "What's the best way to test {topic} locally?",
+]
+LOG_LINE = "2025-09-14T22:{minute:02d}:{second:02d}Z ERROR {topic}: request {request} failed after {ms}ms (retrying)"
+
+
+def generated_reply(rng: random.Random) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(1, 6)):
+        kind = rng.random()
+        if kind < 0.2:
+            paragraphs.append(rng.choice(CODE))
+        elif kind < 0.35:
+            paragraphs.append("\n".join(f"- {rng.choice(SENTENCES).format(topic=rng.choice(TOPICS))}"
+                                        for _ in range(rng.randint(2, 5))))
+        else:
+            paragraphs.append(" ".join(rng.choice(SENTENCES).format(topic=rng.choice(TOPICS))
+                                       for _ in range(rng.randint(2, 6))))
+    return "\n\n".join(paragraphs)
+
+
+def generated_prompt(rng: random.Random) -> str:
+    prompt = rng.choice(QUESTIONS).format(topic=rng.choice(TOPICS))
+    if rng.random() < 0.15:
+        # A pasted log or stack of errors
+        lines = [LOG_LINE.format(minute=rng.randint(0, 59), second=rng.randint(0, 59), topic=rng.choice(TOPICS),
+                                 request=rng.getrandbits(32), ms=rng.randint(100, 30000))
+                 for _ in range(rng.randint(5, 60))]
+        prompt += "\n\n" + "\n".join(lines)
+    return prompt
+
+
+def generated_transcripts(chats: int, seed: int) -> List[List[dict]]:
+    rng = random.Random(seed)
+    transcripts = []
+    for _ in range(chats):
+        turns = []
+        for _ in range(rng.randint(1, 20)):
+            turns.append({"role": "user", "content": generated_prompt(rng)})
+            turns.append({"role": "assistant", "content": generated_reply(rng)})
+        transcripts.append(turns)
+    return transcripts
+
+
+def file_transcripts(path: str) -> List[List[dict]]:
+    with open(path) as f:
+        return [json.loads(line)["messages"] for line in f if line.strip()]
+
+
+def to_messages(transcript: List[dict], chat_id: str) -> List[ChatMessage]:
+    now = datetime.utcnow()
+    return [
+        ChatMessage(
+            id=1_700_000_000_000_000 + i, chat_id=chat_id, user_id=1, created_at=now,
+            message_type=turn["role"], content=turn["content"],
+            model="claude-sonnet-4-20250514" if turn["role"] == "assistant" else None,
+        )
+        for i, turn in enumerate(transcript)
+    ]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+
+def measure(histories: List[List[ChatMessage]], min_bytes: int, link_mbps: float) -> dict:
+    bigtable_chat.COMPRESS_CONTENT_MIN_BYTES = min_bytes
+
+    encode_times, decode_times, sizes = [], [], []
+    for messages in histories:
+        started = time.perf_counter()
+        cells = [(message_row_key(m.chat_id, m.id), pack_message(m)) for m in messages]
+        encode_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        decoded = [unpack_message(key, value) for key, value in cells]
+        decode_times.append(time.perf_counter() - started)
+
+        assert [m.content for m in decoded] == [m.content for m in messages]
+        sizes.append(sum(len(value) for _, value in cells))
+
+    return {
+        "total_bytes": sum(sizes),
+        "mean_history_bytes": round(sum(sizes) / len(sizes)),
+        "p95_history_bytes": round(percentile(sizes, 95)),
+        "p95_transfer_ms": round(percentile(sizes, 95) * 8 / (link_mbps * 1000), 3),
+        "encode_p50_ms": round(percentile(encode_times, 50) * 1000, 3),
+        "encode_p95_ms": round(percentile(encode_times, 95) * 1000, 3),
+        "decode_p50_ms": round(percentile(decode_times, 50) * 1000, 3),
+        "decode_p95_ms": round(percentile(decode_times, 95) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200, help="generated transcripts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--input", help="JSONL transcripts to use instead of generated ones")
+    parser.add_argument("--link-mbps", type=float, default=100.0, help="link speed for the transfer estimate")
+    args = parser.parse_args()
+
+    transcripts = file_transcripts(args.input) if args.input else generated_transcripts(args.chats, args.seed)
+    histories = [to_messages(transcript, f"chat-{i}") for i, transcript in enumerate(transcripts)]
+    content_bytes = sum(len(m.content.encode("utf-8")) for messages in histories for m in messages)
+
+    threshold = bigtable_chat.COMPRESS_CONTENT_MIN_BYTES
+    result = {
+        "histories": len(histories),
+        "messages": sum(len(messages) for messages in histories),
+        "content_bytes": content_bytes,
+        "uncompressed": measure(histories, sys.maxsize, args.link_mbps),
+        f"zstd_above_{threshold}_bytes": measure(histories, threshold, args.link_mbps),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Concurrency ceiling of the NDJSON reply stream: sync threadpool vs async pipeline.
+
+Serves N simultaneous replies through a StreamingResponse the way
+POST /chats/{chat_id} does, once with the old sync Anthropic client inside a
+sync generator (run on Starlette's threadpool) and once with AsyncAnthropic
+inside an async generator. Effective concurrency is how many streams'
+worth of model time were served per second of wall time; the sync pipeline
+tops out near the threadpool size (40) no matter how many streams arrive.
+
+    uv run python benchmarks/stream_concurrency.py --streams 400
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from fake_anthropic import FakeModel
+
+MODEL = "claude-sonnet-4-20250514"
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def sync_app(fake: FakeModel) -> FastAPI:
+    app = FastAPI()
+    client = Anthropic(api_key="fake", http_client=httpx.Client(transport=fake.sync_transport()))
+
+    @app.post("/reply")
+    async def reply():
+        def generate():
+            with client.messages.stream(model=MODEL, max_tokens=1024, messages=MESSAGES) as stream:
+                for text in stream.text_stream:
+                    yield json.dumps({"content": text, "type": "content"}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return app
+
+
+def async_app(fake: FakeModel) -> FastAPI:
+    app = FastAPI()
+    client = AsyncAnthropic(api_key="fake", http_client=httpx.AsyncClient(transport=fake.async_transport()))
+
+    @app.post("/reply")
+    async def reply():
+        async def generate():
+            async with client.messages.stream(model=MODEL, max_tokens=1024, messages=MESSAGES) as stream:
+                async for text in stream.text_stream:
+                    yield json.dumps({"content": text, "type": "content"}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return app
+
+
+async def run(name: str, build_app, streams: int, tokens: int, token_interval: float) -> dict:
+    fake = FakeModel(tokens=tokens, token_interval=token_interval, first_token_latency=token_interval)
+    app = build_app(fake)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        async def one():
+            response = await http.post("/reply")
+            assert response.text.endswith('{"type": "done"}\n')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(streams)))
+        elapsed = time.perf_counter() - started
+
+    single = tokens * token_interval
+    return {
+        "pipeline": name,
+        "streams": streams,
+        "wall_seconds": round(elapsed, 2),
+        "seconds_per_stream": round(single, 2),
+        "effective_concurrency": round(streams * single / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=400)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for name, build_app in (("sync threadpool", sync_app), ("async", async_app)):
+        result = asyncio.run(run(name, build_app, args.streams, args.tokens, args.token_interval))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
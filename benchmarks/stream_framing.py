@@ -0,0 +1,117 @@
+"""CPU per streamed reply and frames per second of reply stream framing, under many concurrent streams.
+
+Runs --streams replies at once through server/streams.py, each fed
+--tokens text deltas at the model's pace and read by one client the way
+StreamingResponse reads it. Deltas arrive --burst at a time, every
+--token-interval * --burst seconds, the way several SSE events land in one
+read from the API connection. Three configurations:
+
+- per_delta_json: one frame per delta, encoded with json.dumps (the old framing)
+- per_delta_orjson: one frame per delta, encoded with orjson
+- coalesced: deltas combined over STREAM_COALESCE_MS / STREAM_COALESCE_CHARS
+
+Reports process CPU per reply, frames and writes (chunks handed to the
+server) per reply and per second, bytes per reply, and the delay between
+the first delta and the reader receiving it. CPU includes the simulated
+model's own scheduling, which is the same in every configuration.
+
+    uv run python benchmarks/stream_framing.py
+    uv run python benchmarks/stream_framing.py --streams 2000 --burst 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+import streams  # noqa: E402
+from streams import ReplyStream  # noqa: E402
+
+WORDS = ["the", " stream", "ing", " response", " is", " written", " one", " token", " at", " a", " time", ",",
+         " so", " each", " delta", " is", " only", " a", " few", " characters", ".", "\n\n", "```", "python"]
+
+
+def json_frame(frame: dict) -> bytes:
+    return (json.dumps(frame) + "\n").encode("utf-8")
+
+
+async def reply(stream: ReplyStream, tokens: int, interval: float, burst: int, sent_at: List[float]):
+    for start in range(0, tokens, burst):
+        await asyncio.sleep(interval * burst)
+        if start == 0:
+            sent_at.append(time.perf_counter())
+        for i in range(start, min(start + burst, tokens)):
+            stream.append_text(WORDS[i % len(WORDS)])
+    stream.append({"type": "done", "usage": {"input_tokens": 100, "output_tokens": tokens}})
+    stream.finish()
+
+
+async def read(stream: ReplyStream, totals: dict, received_at: List[float]):
+    async for chunk in stream.frames():
+        if not received_at:
+            received_at.append(time.perf_counter())
+        totals["writes"] += 1
+        totals["bytes"] += len(chunk)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+
+async def measure(args, coalesce_seconds: float) -> dict:
+    totals = {"writes": 0, "bytes": 0}
+    sent = [[] for _ in range(args.streams)]
+    received = [[] for _ in range(args.streams)]
+    replies = [ReplyStream(f"chat-{i}", 1, coalesce_seconds=coalesce_seconds) for i in range(args.streams)]
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(reply(stream, args.tokens, args.token_interval, args.burst, sent[i]) for i, stream in enumerate(replies)),
+        *(read(stream, totals, received[i]) for i, stream in enumerate(replies)),
+    )
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    frames = sum(stream.last_seq for stream in replies)
+    first_delta_ms = [(r[0] - s[0]) * 1000 for s, r in zip(sent, received)]
+    return {
+        "cpu_ms_per_reply": round(cpu * 1000 / args.streams, 3),
+        "frames_per_reply": round(frames / args.streams, 1),
+        "writes_per_reply": round(totals["writes"] / args.streams, 1),
+        "frames_per_second": round(frames / elapsed),
+        "writes_per_second": round(totals["writes"] / elapsed),
+        "bytes_per_reply": round(totals["bytes"] / args.streams),
+        "first_delta_p50_ms": round(percentile(first_delta_ms, 50), 3),
+        "first_delta_p95_ms": round(percentile(first_delta_ms, 95), 3),
+        "wall_seconds": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=500, help="concurrent replies")
+    parser.add_argument("--tokens", type=int, default=300, help="text deltas per reply")
+    parser.add_argument("--token-interval", type=float, default=0.015, help="seconds per delta (model pace)")
+    parser.add_argument("--burst", type=int, default=3, help="deltas arriving together")
+    args = parser.parse_args()
+
+    encode_frame = streams.encode_frame
+    results = {}
+    streams.encode_frame = json_frame
+    results["per_delta_json"] = asyncio.run(measure(args, 0))
+    streams.encode_frame = encode_frame
+    results["per_delta_orjson"] = asyncio.run(measure(args, 0))
+    results[f"coalesced_{round(streams.STREAM_COALESCE_SECONDS * 1000)}ms"] = asyncio.run(
+        measure(args, streams.STREAM_COALESCE_SECONDS)
+    )
+    print(json.dumps({"streams": args.streams, "tokens": args.tokens, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
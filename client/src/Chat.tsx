@@ -2,8 +2,11 @@ import { Text } from "@mantine/core";
 import { useCallback, useEffect, useRef, useState } from "react";
 import { useLocation, useRoute } from "wouter";
 import { chatById } from "./api-client";
+import type { ChatMessageSchema } from "./api-client";
 import ChatTextbox from "./ChatTextbox";
 
+const MAX_REATTACH_ATTEMPTS = 3;
+
 export default function Chat() {
   const [match, params] = useRoute("/chats/:id");
   const [, , router] = useLocation();
@@ -11,6 +14,8 @@ export default function Chat() {
 
   const [message, setMessage] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  // Shown while a reply waits for a server slot, or after a rate limit
+  const [status, setStatus] = useState<string | null>(null);
   const [messages, setMessages] = useState<
     Array<{ id: string; type: "user" | "assistant"; content: string }>
   >([]);
@@ -31,9 +36,10 @@ export default function Chat() {
       if (!messageToSend.trim() || !chatId) return;
 
       setIsLoading(true);
+      setStatus(null);
 
       try {
-        const apiResponse = await fetch(`/api/chats/${chatId}`, {
+        let apiResponse = await fetch(`/api/chats/${chatId}`, {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
@@ -42,73 +48,105 @@ export default function Chat() {
           credentials: "include",
         });
 
+        if (apiResponse.status === 429) {
+          const retryAfter = apiResponse.headers.get("Retry-After");
+          setStatus(`Too many messages, try again in ${retryAfter ?? "a few"} seconds`);
+          return;
+        }
         if (!apiResponse.ok) throw new Error("Failed to send message");
 
-        const reader = apiResponse.body?.getReader();
         const decoder = new TextDecoder();
+        let assistantResponse = "";
+        // Frames are numbered so a dropped connection can resume after the last one seen
+        let lastSeq = 0;
+        let finished = false;
+        let reattachAttempts = 0;
 
-        if (reader) {
-          let assistantResponse = "";
+        while (true) {
+          const reader = apiResponse.body?.getReader();
+          if (!reader) break;
           let buffer = "";
 
-          while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-
-            buffer += decoder.decode(value, { stream: true });
-            const lines = buffer.split("\n");
-
-            // Keep the last line in buffer (might be incomplete)
-            buffer = lines.pop() || "";
-
-            for (const line of lines) {
-              if (!line.trim()) continue;
-
-              try {
-                const parsed = JSON.parse(line);
-                if (parsed.type === "done") {
-                  console.log("Stream completed");
-                  break;
-                } else if (parsed.type === "chat_created") {
-                  console.log("Chat created:", parsed.chat_id);
-                } else if (parsed.type === "content") {
-                  assistantResponse += parsed.content;
-                  // Update UI in real-time
-                  setMessages((prev) => {
-                    const newMessages = [...prev];
-                    const lastMessage = newMessages[newMessages.length - 1];
-
-                    if (lastMessage && lastMessage.type === "assistant") {
-                      // Update current assistant response with accumulated content
-                      lastMessage.content = assistantResponse;
-                    } else {
-                      // Start new conversation - add user message and assistant response
-                      if (
-                        !newMessages.some(
-                          (m) =>
-                            m.content === messageToSend && m.type === "user"
-                        )
-                      ) {
+          try {
+            while (true) {
+              const { done, value } = await reader.read();
+              if (done) break;
+
+              buffer += decoder.decode(value, { stream: true });
+              const lines = buffer.split("\n");
+
+              // Keep the last line in buffer (might be incomplete)
+              buffer = lines.pop() || "";
+
+              for (const line of lines) {
+                if (!line.trim()) continue;
+
+                try {
+                  const parsed = JSON.parse(line);
+                  if (parsed.seq) lastSeq = parsed.seq;
+                  if (parsed.type === "done") {
+                    console.log("Stream completed");
+                    finished = true;
+                    break;
+                  } else if (parsed.type === "error") {
+                    console.error("Reply failed:", parsed.detail);
+                    finished = true;
+                    break;
+                  } else if (parsed.type === "queued") {
+                    setStatus(`Waiting for a free slot (position ${parsed.position})`);
+                  } else if (parsed.type === "chat_created") {
+                    console.log("Chat created:", parsed.chat_id);
+                  } else if (parsed.type === "content") {
+                    if (!assistantResponse) setStatus(null);
+                    assistantResponse += parsed.content;
+                    // Update UI in real-time
+                    setMessages((prev) => {
+                      const newMessages = [...prev];
+                      const lastMessage = newMessages[newMessages.length - 1];
+
+                      if (lastMessage && lastMessage.type === "assistant") {
+                        // Update current assistant response with accumulated content
+                        lastMessage.content = assistantResponse;
+                      } else {
+                        // Start new conversation - add user message and assistant response
+                        if (
+                          !newMessages.some(
+                            (m) =>
+                              m.content === messageToSend && m.type === "user"
+                          )
+                        ) {
+                          newMessages.push({
+                            id: `user-${Date.now()}`,
+                            type: "user",
+                            content: messageToSend,
+                          });
+                        }
                         newMessages.push({
-                          id: `user-${Date.now()}`,
-                          type: "user",
-                          content: messageToSend,
+                          id: `assistant-${Date.now()}`,
+                          type: "assistant",
+                          content: assistantResponse,
                         });
                       }
-                      newMessages.push({
-                        id: `assistant-${Date.now()}`,
-                        type: "assistant",
-                        content: assistantResponse,
-                      });
-                    }
-                    return newMessages;
-                  });
+                      return newMessages;
+                    });
+                  }
+                } catch (e) {
+                  console.log("Failed to parse JSON:", line);
                 }
-              } catch (e) {
-                console.log("Failed to parse JSON:", line);
               }
             }
+          } catch (error) {
+            console.log("Reply stream interrupted:", error);
           }
+
+          if (finished || ++reattachAttempts > MAX_REATTACH_ATTEMPTS) break;
+
+          // Reattach to the reply, which keeps generating on the server
+          apiResponse = await fetch(
+            `/api/chats/${chatId}/stream?after=${lastSeq}`,
+            { credentials: "include" }
+          );
+          if (!apiResponse.ok) throw new Error("Failed to resume reply");
         }
 
         setMessage("");
@@ -151,18 +189,30 @@ export default function Chat() {
       return;
     }
 
+    // Set when the chat changes or the page unmounts, so a late page is dropped
+    let cancelled = false;
+
     const fetchChatMessages = async () => {
       try {
         setIsLoadingChat(true);
-        const result = await chatById({
-          path: { chat_id: chatId },
-        });
+        // History is paged oldest first; each page is shown as it arrives,
+        // so a long chat paints after one round trip instead of all of them.
+        // Pages carry ETags and "private, no-cache", so the browser revalidates
+        // them with If-None-Match and reuses its copy when the server says 304.
+        let loaded = 0;
+        let cursor: string | null | undefined = undefined;
+        do {
+          const result = await chatById({
+            path: { chat_id: chatId },
+            query: { cursor },
+          });
+          if (cancelled || !result.data) break;
 
-        if (result.data && result.data.messages) {
           // Convert API messages to array format
-          const messageArray = result.data.messages.map(
-            (msg: any, index: number) => ({
-              id: `${msg.message_type}-${index}`,
+          const offset = loaded;
+          const page = result.data.messages.map(
+            (msg: ChatMessageSchema, index) => ({
+              id: `${msg.message_type}-${offset + index}`,
               type:
                 msg.message_type === "user"
                   ? ("user" as const)
@@ -170,19 +220,26 @@ export default function Chat() {
               content: msg.content,
             })
           );
-          setMessages(messageArray);
-        }
+          loaded += page.length;
+          setMessages((prev) => (offset === 0 ? page : [...prev, ...page]));
+          cursor = result.data.next_cursor;
+        } while (cursor);
       } catch (error) {
         console.error("Failed to fetch chat messages:", error);
       } finally {
-        setIsLoadingChat(false);
+        if (!cancelled) setIsLoadingChat(false);
       }
     };
 
     fetchChatMessages();
+    return () => {
+      cancelled = true;
+    };
   }, [chatId]);
 
   const handleSubmit = async () => {
+    // Ctrl+Enter doesn't go through the button's loading state
+    if (isLoadingChat) return;
     await handleSubmitWithMessage(message);
   };
 
@@ -248,11 +305,17 @@ export default function Chat() {
           backgroundColor: "white",
         }}
       >
+        {status && (
+          <Text size="sm" c="dimmed" mb="xs">
+            {status}
+          </Text>
+        )}
+        {/* Held until the rest of the history is in, so a reply can't land between its pages */}
         <ChatTextbox
           value={message}
           onChange={setMessage}
           onSubmit={handleSubmit}
-          isLoading={isLoading}
+          isLoading={isLoading || isLoadingChat}
         />
       </div>
     </div>
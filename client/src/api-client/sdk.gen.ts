@@ -1,7 +1,7 @@
 // This file is auto-generated by @hey-api/openapi-ts
 
 import type { Options as ClientOptions, TDataShape, Client } from './client';
-import type { AuthLoginData, AuthLoginResponses, AuthCallbackData, AuthCallbackResponses, AuthLogoutData, AuthLogoutResponses, AuthGetMeData, AuthGetMeResponses, ChatAllData, ChatAllResponses, ChatCreateData, ChatCreateResponses, ChatCreateErrors, ChatByIdData, ChatByIdResponses, ChatByIdErrors, ChatExtendData, ChatExtendResponses, ChatExtendErrors } from './types.gen';
+import type { AuthLoginData, AuthLoginResponses, AuthCallbackData, AuthCallbackResponses, AuthLogoutData, AuthLogoutResponses, AuthGetMeData, AuthGetMeResponses, ChatAllData, ChatAllResponses, ChatAllErrors, ChatByIdData, ChatByIdResponses, ChatByIdErrors, ChatMessageData, ChatMessageResponses, ChatMessageErrors, ChatStreamData, ChatStreamResponses, ChatStreamErrors, UsageGetData, UsageGetResponses, UsageGetErrors } from './types.gen';
 import { client as _heyApiClient } from './client.gen';
 
 export type Options<TData extends TDataShape = TDataShape, ThrowOnError extends boolean = boolean> = ClientOptions<TData, ThrowOnError> & {
@@ -61,33 +61,18 @@ export const authGetMe = <ThrowOnError extends boolean = false>(options?: Option
 
 /**
  * Get Chats
- * Get list of chats (id and title only) for the current user
+ * Get a page of chats (id and title only) for the current user, newest first
  */
 export const chatAll = <ThrowOnError extends boolean = false>(options?: Options<ChatAllData, ThrowOnError>) => {
-    return (options?.client ?? _heyApiClient).get<ChatAllResponses, unknown, ThrowOnError>({
+    return (options?.client ?? _heyApiClient).get<ChatAllResponses, ChatAllErrors, ThrowOnError>({
         url: '/chats',
         ...options
     });
 };
 
-/**
- * Create Chat And Stream
- * Create a new chat and stream the response
- */
-export const chatCreate = <ThrowOnError extends boolean = false>(options: Options<ChatCreateData, ThrowOnError>) => {
-    return (options.client ?? _heyApiClient).post<ChatCreateResponses, ChatCreateErrors, ThrowOnError>({
-        url: '/chats',
-        ...options,
-        headers: {
-            'Content-Type': 'application/json',
-            ...options.headers
-        }
-    });
-};
-
 /**
  * Get Chat With Messages
- * Get a specific chat and all of its messages
+ * Get a specific chat and a page of its messages, oldest first
  */
 export const chatById = <ThrowOnError extends boolean = false>(options: Options<ChatByIdData, ThrowOnError>) => {
     return (options.client ?? _heyApiClient).get<ChatByIdResponses, ChatByIdErrors, ThrowOnError>({
@@ -97,11 +82,11 @@ export const chatById = <ThrowOnError extends boolean = false>(options: Options<
 };
 
 /**
- * Add To Chat And Stream
- * Add a message to an existing chat and stream the response
+ * Send Message To Chat
+ * Send a message to a chat. Creates chat if it doesn't exist, otherwise appends to existing chat.
  */
-export const chatExtend = <ThrowOnError extends boolean = false>(options: Options<ChatExtendData, ThrowOnError>) => {
-    return (options.client ?? _heyApiClient).post<ChatExtendResponses, ChatExtendErrors, ThrowOnError>({
+export const chatMessage = <ThrowOnError extends boolean = false>(options: Options<ChatMessageData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).post<ChatMessageResponses, ChatMessageErrors, ThrowOnError>({
         url: '/chats/{chat_id}',
         ...options,
         headers: {
@@ -109,4 +94,26 @@ export const chatExtend = <ThrowOnError extends boolean = false>(options: Option
             ...options.headers
         }
     });
+};
+
+/**
+ * Resume Chat Stream
+ * Reattach to a chat's in-progress (or just finished) reply, replaying frames numbered above `after`
+ */
+export const chatStream = <ThrowOnError extends boolean = false>(options: Options<ChatStreamData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).get<ChatStreamResponses, ChatStreamErrors, ThrowOnError>({
+        url: '/chats/{chat_id}/stream',
+        ...options
+    });
+};
+
+/**
+ * Get Usage
+ * Get the current user's token usage per UTC day, from start to end inclusive (default: last 30 days)
+ */
+export const usageGet = <ThrowOnError extends boolean = false>(options?: Options<UsageGetData, ThrowOnError>) => {
+    return (options?.client ?? _heyApiClient).get<UsageGetResponses, UsageGetErrors, ThrowOnError>({
+        url: '/usage',
+        ...options
+    });
 };
\ No newline at end of file
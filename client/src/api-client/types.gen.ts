@@ -1,5 +1,164 @@
 // This file is auto-generated by @hey-api/openapi-ts
 
+/**
+ * ChatDetailSchema
+ * A chat with one page of its messages, oldest first
+ */
+export type ChatDetailSchema = {
+    chat: ChatSchema;
+    /**
+     * Messages
+     */
+    messages: Array<ChatMessageSchema>;
+    /**
+     * Next Cursor
+     */
+    next_cursor?: string | null;
+};
+
+/**
+ * ChatListSchema
+ * One page of a user's chats, newest first
+ */
+export type ChatListSchema = {
+    /**
+     * Chats
+     */
+    chats: Array<ChatSummarySchema>;
+    /**
+     * Next Cursor
+     */
+    next_cursor?: string | null;
+};
+
+/**
+ * ChatMessageSchema
+ */
+export type ChatMessageSchema = {
+    /**
+     * Id
+     */
+    id: number;
+    /**
+     * Chat Id
+     */
+    chat_id: string;
+    /**
+     * User Id
+     */
+    user_id: number;
+    /**
+     * Message Type
+     */
+    message_type: string;
+    /**
+     * Content
+     */
+    content: string;
+    /**
+     * Tokens Used
+     */
+    tokens_used?: number | null;
+    /**
+     * Input Tokens
+     */
+    input_tokens?: number | null;
+    /**
+     * Output Tokens
+     */
+    output_tokens?: number | null;
+    /**
+     * Cache Read Input Tokens
+     */
+    cache_read_input_tokens?: number | null;
+    /**
+     * Cache Creation Input Tokens
+     */
+    cache_creation_input_tokens?: number | null;
+    /**
+     * Model
+     */
+    model?: string | null;
+    /**
+     * Truncated
+     */
+    truncated?: boolean;
+    /**
+     * Created At
+     */
+    created_at: string;
+};
+
+/**
+ * ChatSchema
+ */
+export type ChatSchema = {
+    /**
+     * Id
+     */
+    id: string;
+    /**
+     * Title
+     */
+    title: string;
+    /**
+     * User Id
+     */
+    user_id: number;
+    /**
+     * Created At
+     */
+    created_at: string;
+    /**
+     * Updated At
+     */
+    updated_at?: string | null;
+};
+
+/**
+ * ChatSummarySchema
+ */
+export type ChatSummarySchema = {
+    /**
+     * Id
+     */
+    id: string;
+    /**
+     * Title
+     */
+    title: string;
+};
+
+/**
+ * DailyUsageSchema
+ */
+export type DailyUsageSchema = {
+    /**
+     * Input Tokens
+     */
+    input_tokens?: number;
+    /**
+     * Output Tokens
+     */
+    output_tokens?: number;
+    /**
+     * Cache Read Input Tokens
+     */
+    cache_read_input_tokens?: number;
+    /**
+     * Cache Creation Input Tokens
+     */
+    cache_creation_input_tokens?: number;
+    /**
+     * Replies
+     */
+    replies?: number;
+    /**
+     * Day
+     */
+    day: string;
+};
+
 /**
  * HTTPValidationError
  */
@@ -10,6 +169,45 @@ export type HttpValidationError = {
     detail?: Array<ValidationError>;
 };
 
+/**
+ * TokenUsage
+ * Token counts for one model reply, or a sum of them
+ */
+export type TokenUsage = {
+    /**
+     * Input Tokens
+     */
+    input_tokens?: number;
+    /**
+     * Output Tokens
+     */
+    output_tokens?: number;
+    /**
+     * Cache Read Input Tokens
+     */
+    cache_read_input_tokens?: number;
+    /**
+     * Cache Creation Input Tokens
+     */
+    cache_creation_input_tokens?: number;
+    /**
+     * Replies
+     */
+    replies?: number;
+};
+
+/**
+ * UsageSchema
+ * A user's token usage per UTC day over a date range, and its total
+ */
+export type UsageSchema = {
+    /**
+     * Days
+     */
+    days: Array<DailyUsageSchema>;
+    total: TokenUsage;
+};
+
 /**
  * UserSchema
  */
@@ -122,112 +320,189 @@ export type AuthGetMeResponse = AuthGetMeResponses[keyof AuthGetMeResponses];
 
 export type ChatAllData = {
     body?: never;
+    headers?: {
+        /**
+         * If-None-Match
+         */
+        'if-none-match'?: string | null;
+    };
     path?: never;
-    query?: never;
+    query?: {
+        /**
+         * Cursor
+         */
+        cursor?: string | null;
+        /**
+         * Limit
+         */
+        limit?: number;
+    };
     url: '/chats';
 };
 
+export type ChatAllErrors = {
+    /**
+     * Validation Error
+     */
+    422: HttpValidationError;
+};
+
+export type ChatAllError = ChatAllErrors[keyof ChatAllErrors];
+
 export type ChatAllResponses = {
     /**
-     * Response Chat All
      * Successful Response
      */
-    200: Array<{
-        [key: string]: unknown;
-    }>;
+    200: ChatListSchema;
 };
 
 export type ChatAllResponse = ChatAllResponses[keyof ChatAllResponses];
 
-export type ChatCreateData = {
+export type ChatByIdData = {
+    body?: never;
+    headers?: {
+        /**
+         * If-None-Match
+         */
+        'if-none-match'?: string | null;
+    };
+    path: {
+        /**
+         * Chat Id
+         */
+        chat_id: string;
+    };
+    query?: {
+        /**
+         * Cursor
+         */
+        cursor?: string | null;
+        /**
+         * Limit
+         */
+        limit?: number;
+    };
+    url: '/chats/{chat_id}';
+};
+
+export type ChatByIdErrors = {
+    /**
+     * Validation Error
+     */
+    422: HttpValidationError;
+};
+
+export type ChatByIdError = ChatByIdErrors[keyof ChatByIdErrors];
+
+export type ChatByIdResponses = {
+    /**
+     * Successful Response
+     */
+    200: ChatDetailSchema;
+};
+
+export type ChatByIdResponse = ChatByIdResponses[keyof ChatByIdResponses];
+
+export type ChatMessageData = {
     /**
      * Request
      */
     body: {
         [key: string]: unknown;
     };
-    path?: never;
+    path: {
+        /**
+         * Chat Id
+         */
+        chat_id: string;
+    };
     query?: never;
-    url: '/chats';
+    url: '/chats/{chat_id}';
 };
 
-export type ChatCreateErrors = {
+export type ChatMessageErrors = {
     /**
      * Validation Error
      */
     422: HttpValidationError;
 };
 
-export type ChatCreateError = ChatCreateErrors[keyof ChatCreateErrors];
+export type ChatMessageError = ChatMessageErrors[keyof ChatMessageErrors];
 
-export type ChatCreateResponses = {
+export type ChatMessageResponses = {
     /**
      * Successful Response
      */
     200: unknown;
 };
 
-export type ChatByIdData = {
+export type ChatStreamData = {
     body?: never;
     path: {
         /**
          * Chat Id
          */
-        chat_id: number;
+        chat_id: string;
     };
-    query?: never;
-    url: '/chats/{chat_id}';
+    query?: {
+        /**
+         * After
+         */
+        after?: number;
+    };
+    url: '/chats/{chat_id}/stream';
 };
 
-export type ChatByIdErrors = {
+export type ChatStreamErrors = {
     /**
      * Validation Error
      */
     422: HttpValidationError;
 };
 
-export type ChatByIdError = ChatByIdErrors[keyof ChatByIdErrors];
+export type ChatStreamError = ChatStreamErrors[keyof ChatStreamErrors];
 
-export type ChatByIdResponses = {
+export type ChatStreamResponses = {
     /**
      * Successful Response
      */
     200: unknown;
 };
 
-export type ChatExtendData = {
-    /**
-     * Request
-     */
-    body: {
-        [key: string]: unknown;
-    };
-    path: {
+export type UsageGetData = {
+    body?: never;
+    path?: never;
+    query?: {
         /**
-         * Chat Id
+         * Start
          */
-        chat_id: number;
+        start?: string | null;
+        /**
+         * End
+         */
+        end?: string | null;
     };
-    query?: never;
-    url: '/chats/{chat_id}';
+    url: '/usage';
 };
 
-export type ChatExtendErrors = {
+export type UsageGetErrors = {
     /**
      * Validation Error
      */
     422: HttpValidationError;
 };
 
-export type ChatExtendError = ChatExtendErrors[keyof ChatExtendErrors];
+export type UsageGetError = UsageGetErrors[keyof UsageGetErrors];
 
-export type ChatExtendResponses = {
+export type UsageGetResponses = {
     /**
      * Successful Response
      */
-    200: unknown;
+    200: UsageSchema;
 };
 
+export type UsageGetResponse = UsageGetResponses[keyof UsageGetResponses];
+
 export type ClientOptions = {
     baseUrl: 'http://localhost:8000' | (string & {});
 };
\ No newline at end of file
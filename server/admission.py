@@ -0,0 +1,257 @@
+"""Admission control for model replies: per-user rate limits and a fair stream queue.
+
+Every POST /chats/{chat_id} asks the scheduler for a ticket before a reply
+is started:
+
+- Each user has a token bucket (USER_REPLY_BURST replies, refilled at
+  USER_REPLIES_PER_MINUTE). An empty bucket, or a full queue, rejects the
+  request at once with the seconds until it is worth retrying, which the
+  API returns as a 429 with Retry-After.
+- At most REPLY_MAX_IN_FLIGHT replies stream from the model at once, and
+  at most REPLY_MAX_IN_FLIGHT_PER_USER of them for one user. Tickets beyond
+  that wait in per-user FIFO queues that are served round-robin across
+  users, so one user with many tabs can't starve everyone else. Waiting
+  replies are told their position in queued frames on the NDJSON stream.
+
+Limits apply per worker process, like the reply streams themselves.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+from metrics import reply_queue_wait_seconds
+
+REPLY_MAX_IN_FLIGHT = int(os.getenv("REPLY_MAX_IN_FLIGHT", "256"))
+REPLY_MAX_IN_FLIGHT_PER_USER = int(os.getenv("REPLY_MAX_IN_FLIGHT_PER_USER", "3"))
+REPLY_MAX_QUEUED = int(os.getenv("REPLY_MAX_QUEUED", "1024"))
+# Suggested wait for a request turned away because the queue is full
+REPLY_QUEUE_FULL_RETRY_SECONDS = float(os.getenv("REPLY_QUEUE_FULL_RETRY_SECONDS", "5"))
+USER_REPLY_BURST = float(os.getenv("USER_REPLY_BURST", "10"))
+USER_REPLIES_PER_MINUTE = float(os.getenv("USER_REPLIES_PER_MINUTE", "20"))
+
+
+class AdmissionRejected(Exception):
+    """A reply was refused; retry_after is how long the client should wait"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """capacity tokens, refilled continuously at rate tokens per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self) -> float:
+        """Take one token; returns 0 on success, else the seconds until one is available"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class Ticket:
+    """One reply's claim on a stream slot, granted at once or after queueing"""
+
+    def __init__(self, scheduler: "ReplyScheduler", user_id: int):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.granted = False
+        self.released = False
+        self.queued_at = time.monotonic()
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[Callable[[int], None]] = None):
+        """Wait for a slot, reporting queue positions as they change, and hold it for the block"""
+        try:
+            await self.scheduler._wait(self, on_position)
+            yield
+        finally:
+            # Also runs if the reply is cancelled while still queued
+            self.release()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+
+class ReplyScheduler:
+    def __init__(
+        self,
+        max_in_flight: int = REPLY_MAX_IN_FLIGHT,
+        max_in_flight_per_user: int = REPLY_MAX_IN_FLIGHT_PER_USER,
+        max_queued: int = REPLY_MAX_QUEUED,
+        burst: float = USER_REPLY_BURST,
+        replies_per_minute: float = USER_REPLIES_PER_MINUTE,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_user = max_in_flight_per_user
+        self.max_queued = max_queued
+        self.burst = burst
+        self.rate = replies_per_minute / 60
+        self.in_flight = 0
+        self._in_flight_by_user: Dict[int, int] = {}
+        # Users with waiting tickets, in round-robin order, and their FIFO queues
+        self._queues: "OrderedDict[int, Deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._changed = asyncio.Event()
+        self.admitted = 0
+        self.rejected_rate_limited = 0
+        self.rejected_queue_full = 0
+
+    def admit(self, user_id: int) -> Ticket:
+        """Charge the user's rate limit and return a ticket, granted now if a slot is free.
+
+        Raises AdmissionRejected when the user is over their rate limit or the queue is full.
+        """
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            self._prune_buckets()
+            bucket = self._buckets[user_id] = TokenBucket(self.burst, self.rate)
+        wait = bucket.take()
+        if wait:
+            self.rejected_rate_limited += 1
+            raise AdmissionRejected("Rate limit exceeded", wait)
+
+        ticket = Ticket(self, user_id)
+        if not self._queued and self._has_slot(user_id):
+            self._grant(ticket)
+        elif self._queued >= self.max_queued:
+            bucket.tokens += 1  # refund: nothing was started
+            self.rejected_queue_full += 1
+            raise AdmissionRejected("Too many replies queued", REPLY_QUEUE_FULL_RETRY_SECONDS)
+        else:
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            self._queued += 1
+            # A user under their own cap may still be served ahead of others' queues
+            self._dispatch()
+        self.admitted += 1
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the round-robin order, if no per-user cap holds anyone back"""
+        queue = self._queues.get(ticket.user_id)
+        if ticket.granted or queue is None:
+            return 0
+        index = queue.index(ticket)
+        ahead = 0
+        for user_id, other in self._queues.items():
+            if user_id == ticket.user_id:
+                # Users before this one in the rotation get one more turn in the current round
+                ahead += index
+                break
+            ahead += min(len(other), index + 1)
+        else:
+            return ahead + 1
+        for user_id, other in reversed(self._queues.items()):
+            if user_id == ticket.user_id:
+                break
+            ahead += min(len(other), index)
+        return ahead + 1
+
+    def _has_slot(self, user_id: int) -> bool:
+        return (
+            self.in_flight < self.max_in_flight
+            and self._in_flight_by_user.get(user_id, 0) < self.max_in_flight_per_user
+        )
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        self.in_flight += 1
+        self._in_flight_by_user[ticket.user_id] = self._in_flight_by_user.get(ticket.user_id, 0) + 1
+        reply_queue_wait_seconds.observe(time.monotonic() - ticket.queued_at)
+
+    def _dispatch(self):
+        """Grant free slots to queued tickets, taking users in turn"""
+        changed = False
+        while self.in_flight < self.max_in_flight and self._queues:
+            for user_id in self._queues:
+                if self._has_slot(user_id):
+                    break
+            else:
+                break  # every waiting user is at their own cap
+            queue = self._queues.pop(user_id)
+            self._grant(queue.popleft())
+            self._queued -= 1
+            changed = True
+            if queue:
+                # Back of the rotation, so the next slot goes to someone else
+                self._queues[user_id] = queue
+        if changed:
+            self._notify()
+
+    def _release(self, ticket: Ticket):
+        if ticket.granted:
+            self.in_flight -= 1
+            remaining = self._in_flight_by_user[ticket.user_id] - 1
+            if remaining:
+                self._in_flight_by_user[ticket.user_id] = remaining
+            else:
+                del self._in_flight_by_user[ticket.user_id]
+        else:
+            queue = self._queues[ticket.user_id]
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.user_id]
+            self._notify()
+        self._dispatch()
+
+    async def _wait(self, ticket: Ticket, on_position: Optional[Callable[[int], None]]):
+        reported = None
+        while not ticket.granted:
+            changed = self._changed
+            position = self.position(ticket)
+            if on_position and position != reported:
+                on_position(position)
+                reported = position
+            await changed.wait()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _prune_buckets(self):
+        # A full bucket is the same as no bucket, so idle users cost no memory
+        if len(self._buckets) >= 10000:
+            now = time.monotonic()
+            for user_id in [u for u, bucket in self._buckets.items() if bucket.is_full(now)]:
+                del self._buckets[user_id]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_queue_full": self.rejected_queue_full,
+        }
+
+
+reply_scheduler = ReplyScheduler()
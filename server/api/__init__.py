@@ -5,3 +5,4 @@ api = APIRouter()
 # Import auth routes to register them
 from . import auth
 from . import chat
+from . import usage
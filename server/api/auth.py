@@ -2,12 +2,13 @@ from . import api
 from starlette.middleware.sessions import SessionMiddleware
 import os
 from datetime import timedelta
-from auth import oauth, get_current_user, get_or_create_user, create_access_token
+from authlib.integrations.base_client import OAuthError
+from auth import oauth, fetch_google_user_info, get_current_user, get_or_create_user, create_access_token, load_google_metadata
 from fastapi import HTTPException, Request, Depends, Response
 from fastapi.responses import RedirectResponse
 
 from models import get_db, User, UserSchema
-from models.bigtable_user import BigtableUserService
+from models.storage import UserStore
 import httpx
 
 HOST = os.getenv("HOST", "http://localhost:5173")
@@ -18,6 +19,7 @@ async def login(request: Request):
     # Use frontend URL for OAuth callback
     redirect_uri = f"{HOST}/auth/callback"
     try:
+        await load_google_metadata()
         return await oauth.google.authorize_redirect(request, redirect_uri)  # type: ignore
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OAuth setup error: {str(e)}")
@@ -27,7 +29,7 @@ async def login(request: Request):
 async def auth_callback(
     request: Request,
     response: Response,
-    db_service: BigtableUserService = Depends(get_db),
+    db_service: UserStore = Depends(get_db),
 ):
     """Handle OAuth callback - expects auth code from frontend"""
     try:
@@ -37,27 +39,8 @@ async def auth_callback(
         if not auth_code:
             raise HTTPException(status_code=400, detail="Missing authorization code")
 
-        token_url = "https://oauth2.googleapis.com/token"
-
-        token_data = {
-            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-            "code": auth_code,
-            "grant_type": "authorization_code",
-            "redirect_uri": f"{HOST}/auth/callback",
-        }
-
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(token_url, data=token_data)
-            token_response.raise_for_status()
-            tokens = token_response.json()
-
-        # Get user info
-        userinfo_url = f"https://www.googleapis.com/oauth2/v2/userinfo?access_token={tokens['access_token']}"
-        async with httpx.AsyncClient() as client:
-            user_response = await client.get(userinfo_url)
-            user_response.raise_for_status()
-            user_info = user_response.json()
+        # Token exchange and ID token verification over the shared connection pool
+        user_info = await fetch_google_user_info(auth_code, f"{HOST}/auth/callback")
 
         if not user_info:
             raise HTTPException(status_code=400, detail="Failed to get user info")
@@ -97,6 +80,11 @@ async def auth_callback(
 
         return {"user": user, "success": True}
 
+    except OAuthError as e:
+        print(f"OAuth error during token exchange: {e}")
+        raise HTTPException(
+            status_code=400, detail=f"Token exchange failed: {e}"
+        )
     except httpx.HTTPStatusError as e:
         print(f"HTTP error during token exchange: {e.response.text}")
         raise HTTPException(
@@ -1,62 +1,165 @@
-import json
-from typing import List
-from fastapi import HTTPException, Depends
+import asyncio
+import re
+import time
+from typing import Optional
+from fastapi import HTTPException, Depends, Header, Query, Response
 from fastapi.responses import StreamingResponse
 import os
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+from anthropic.types import Usage
 from api import api
-from models.bigtable_chat import BigtableChatService
-from models.chat import Chat, ChatMessage, ChatCreate, ChatMessageCreate
+from models import get_chat_db, get_usage_db
+from models.chat import Chat, ChatMessage, ChatCreate, ChatMessageCreate, ChatListSchema, ChatDetailSchema
+from models.usage import TokenUsage
 from auth import get_current_user
+from context import build_context
+from etags import PRIVATE_REVALIDATE_CACHE_CONTROL, etag_matches, weak_etag
+from admission import AdmissionRejected, Ticket, reply_scheduler
+from http_clients import anthropic_pool
+from metrics import ReplyTimer
+from streams import ReplyStream, reply_streams
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-chat_service = BigtableChatService()
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 1024
 
+CHAT_PAGE_SIZE = 50
+MAX_CHAT_PAGE_SIZE = 200
+MESSAGE_PAGE_SIZE = 100
+MAX_MESSAGE_PAGE_SIZE = 500
 
-@api.get("/chats", response_model=List[dict], operation_id="chat_all")
-async def get_chats(current_user=Depends(get_current_user)):
-    """Get list of chats (id and title only) for the current user"""
-    chats = chat_service.get_chats_by_user_id(current_user.id)
-    return [{"id": chat.id, "title": chat.title} for chat in chats]
+# Chat IDs become part of Bigtable row keys, so nothing that could reach
+# into another key's range ('#' above all) gets past the API. Client IDs
+# are UUIDs.
+CHAT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
 
+# One client per worker, shared by every in-flight reply, on the app-wide
+# Anthropic connection pool (see http_clients)
+client = AsyncAnthropic(
+    api_key=os.getenv("ANTHROPIC_API_KEY"),
+    http_client=DefaultAsyncHttpxClient(transport=anthropic_pool),
+)
+chat_service = get_chat_db()
+usage_service = get_usage_db()
 
-@api.get("/chats/{chat_id}", operation_id="chat_by_id")
-async def get_chat_with_messages(chat_id: str, current_user=Depends(get_current_user)):
-    """Get a specific chat and all of its messages"""
-    chat = chat_service.get_chat_by_id(chat_id)
+
+def token_usage(usage: Optional[Usage], output_tokens: Optional[int] = None) -> TokenUsage:
+    """One reply's TokenUsage from the SDK's usage block, which may be missing or partial"""
+    return TokenUsage(
+        input_tokens=usage.input_tokens if usage else 0,
+        output_tokens=output_tokens if output_tokens is not None else (usage.output_tokens if usage else 0),
+        cache_read_input_tokens=(usage.cache_read_input_tokens or 0) if usage else 0,
+        cache_creation_input_tokens=(usage.cache_creation_input_tokens or 0) if usage else 0,
+        replies=1,
+    )
+
+
+def valid_chat_id(chat_id: str) -> str:
+    """The chat_id path parameter, rejected with a 400 unless it is a safe row key part"""
+    if not CHAT_ID_PATTERN.fullmatch(chat_id):
+        raise HTTPException(status_code=400, detail="Invalid chat ID")
+    return chat_id
+
+
+def not_modified(response: Response, etag: Optional[str], if_none_match: Optional[str]) -> Optional[Response]:
+    """A 304 if the client's copy is current, else None after putting the validator on response.
+
+    Browsers keep the body and revalidate it with If-None-Match on every fetch.
+    """
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": PRIVATE_REVALIDATE_CACHE_CONTROL}
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+@api.get("/chats", response_model=ChatListSchema, operation_id="chat_all")
+async def get_chats(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=MAX_CHAT_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    current_user=Depends(get_current_user),
+):
+    """Get a page of chats (id and title only) for the current user, newest first"""
+    # One counter row instead of the index scan when the client's copy is current
+    version = await chat_service.get_chat_list_version(current_user.id)
+    etag = weak_etag("chats", current_user.id, version, cursor, limit) if version is not None else None
+    if unchanged := not_modified(response, etag, if_none_match):
+        return unchanged
+
+    try:
+        chats, next_cursor = await chat_service.get_chats_page(current_user.id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"chats": [{"id": chat.id, "title": chat.title} for chat in chats], "next_cursor": next_cursor}
+
+
+@api.get("/chats/{chat_id}", response_model=ChatDetailSchema, operation_id="chat_by_id")
+async def get_chat_with_messages(
+    response: Response,
+    chat_id: str = Depends(valid_chat_id),
+    cursor: Optional[str] = None,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    current_user=Depends(get_current_user),
+):
+    """Get a specific chat and a page of its messages, oldest first"""
+    # The chat row alone; every message write bumps its updated_at, and only
+    # once the message rows are stored (see create_messages), so a body read
+    # after the chat always has every message its ETag's updated_at covers
+    chat = await chat_service.get_chat_by_id(chat_id)
     if not chat or chat.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    messages = chat_service.get_messages_by_chat_id(chat_id)
-    return {"chat": chat, "messages": messages}
+    etag = weak_etag("chat", chat.id, chat.updated_at.isoformat(), cursor, limit) if chat.updated_at else None
+    if unchanged := not_modified(response, etag, if_none_match):
+        return unchanged
+
+    try:
+        messages, next_cursor = await chat_service.get_messages_page(chat_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"chat": chat, "messages": messages, "next_cursor": next_cursor}
 
 
 @api.post("/chats/{chat_id}", operation_id="chat_message")
 async def send_message_to_chat(
-    chat_id: str, request: dict, current_user=Depends(get_current_user)
+    request: dict, chat_id: str = Depends(valid_chat_id), current_user=Depends(get_current_user)
 ):
     """Send a message to a chat. Creates chat if it doesn't exist, otherwise appends to existing chat."""
     user_message = request.get("message", "")
     if not user_message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
+    # Before any storage work, so a rate-limited user costs next to nothing
+    try:
+        ticket = reply_scheduler.admit(current_user.id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": e.retry_after_header})
+    try:
+        return await start_reply(chat_id, request, user_message, current_user, ticket)
+    except BaseException:
+        # The reply never started; generate() owns the ticket once it has
+        ticket.release()
+        raise
+
+
+async def start_reply(chat_id: str, request: dict, user_message: str, current_user, ticket: Ticket):
+    """Load or create the chat and start its reply stream under an admitted ticket"""
     # Check if chat exists
-    chat = chat_service.get_chat_by_id(chat_id)
+    chat = await chat_service.get_chat_by_id(chat_id)
 
     if chat:
         # Chat exists - verify ownership
         if chat.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Access denied")
 
-        # Get conversation history for existing chat
-        messages = chat_service.get_messages_by_chat_id(chat_id)
-        conversation_history = []
-        for msg in messages:
-            role = "user" if msg.message_type == "user" else "assistant"
-            conversation_history.append({"role": role, "content": msg.content})
-
-        # Add current message to history
-        conversation_history.append({"role": "user", "content": user_message})
+        # Get conversation history for existing chat, trimmed to the context
+        # budget and with a cache breakpoint on the stable prefix
+        messages = await chat_service.get_conversation_history(chat)
+        conversation_history, system = build_context(messages, user_message)
 
         is_new_chat = False
     else:
@@ -65,43 +168,117 @@ async def send_message_to_chat(
             "title",
             user_message[:50] + "..." if len(user_message) > 50 else user_message,
         )
-        chat = chat_service.create_chat(
+        chat = await chat_service.create_chat(
             title=title, user_id=current_user.id, chat_id=chat_id
         )
-        conversation_history = [{"role": "user", "content": user_message}]
+        # A concurrent first message may have created it first, in which case
+        # this is that chat; ours starts with a cached empty history
+        if chat.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Access denied")
+        messages = await chat_service.get_conversation_history(chat)
+        conversation_history, system = build_context(messages, user_message)
         is_new_chat = True
 
-    # Create user message
-    chat_service.create_message(
-        chat_id=chat.id,
-        user_id=current_user.id,
-        message_type="user",
-        content=user_message,
-    )
+    # Checked with no await before start(), so two requests can't both pass
+    if reply_streams.is_generating(chat.id):
+        raise HTTPException(status_code=409, detail="A reply is already being generated for this chat")
 
-    def generate():
-        if is_new_chat:
-            yield json.dumps({"chat_id": chat.id, "type": "chat_created"}) + "\n"
-
-        with client.messages.stream(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1024,
-            messages=conversation_history,
-        ) as stream:
-            assistant_content = ""
-            for text in stream.text_stream:
-                assistant_content += text
-                yield json.dumps({"content": text, "type": "content"}) + "\n"
-
-        # Save assistant response
-        chat_service.create_message(
+    async def generate(stream: ReplyStream):
+        # Runs as a background task that outlives the request, so a client
+        # whose connection drops can reattach to the same reply. Waits its
+        # turn for a stream slot first, telling the client where it stands.
+        async with ticket.slot(lambda position: stream.append({"type": "queued", "position": position})):
+            await reply(stream)
+
+    async def reply(stream: ReplyStream):
+        user_turn = await chat_service.create_message(
             chat_id=chat.id,
             user_id=current_user.id,
-            message_type="assistant",
-            content=assistant_content,
-            model="claude-sonnet-4-20250514",
+            message_type="user",
+            content=user_message,
+            previous_updated_at=chat.updated_at,
+        )
+
+        if is_new_chat:
+            stream.append({"chat_id": chat.id, "type": "chat_created"})
+
+        request_options = {"system": system} if system else {}
+        assistant_content = ""
+        # Text deltas seen, each roughly a token
+        output_deltas = 0
+        # Usage as of message_start, for replies that never reach the final message
+        start_usage = None
+        started = time.monotonic()
+        timer = ReplyTimer()
+        try:
+            async with client.messages.stream(
+                model=MODEL,
+                max_tokens=MAX_TOKENS,
+                messages=conversation_history,
+                **request_options,
+            ) as model_stream:
+                async for event in model_stream:
+                    if event.type == "message_start":
+                        # Input is billed from here, even if no text ever follows
+                        start_usage = event.message.usage
+                    elif event.type == "text":
+                        timer.token()
+                        assistant_content += event.text
+                        output_deltas += 1
+                        stream.append_text(event.text)
+                usage = token_usage((await model_stream.get_final_message()).usage)
+            timer.finish(usage.output_tokens)
+        except asyncio.CancelledError:
+            # Every reader went away; leaving the block above closed the
+            # model stream. Keep what was generated so the history stays whole.
+            usage = token_usage(start_usage, output_tokens=output_deltas)
+            if assistant_content:
+                await save_reply(assistant_content, usage, user_turn, truncated=True)
+            else:
+                # Abandoned before the first token: an empty assistant turn
+                # would make every later request in the chat invalid
+                await usage_service.record_usage(current_user.id, usage)
+            reply_streams.record_abandoned(output_deltas, time.monotonic() - started)
+            raise
+
+        # Shielded so a late abandon can't lose a finished reply
+        await asyncio.shield(save_reply(assistant_content, usage, user_turn))
+
+        stream.append({"type": "done", "usage": usage.model_dump(exclude={"replies"})})
+
+    async def save_reply(content: str, usage: TokenUsage, user_turn: ChatMessage, truncated: bool = False):
+        await asyncio.gather(
+            chat_service.create_message(
+                chat_id=chat.id,
+                user_id=current_user.id,
+                message_type="assistant",
+                content=content,
+                model=MODEL,
+                truncated=truncated,
+                usage=usage,
+                # The user turn was this chat's last write that we know of
+                previous_updated_at=user_turn.created_at,
+            ),
+            usage_service.record_usage(current_user.id, usage),
         )
 
-        yield json.dumps({"type": "done"}) + "\n"
+    stream = reply_streams.start(chat.id, current_user.id, generate)
+    # Also frees the slot if the task is cancelled before generate() ever runs
+    stream.task.add_done_callback(lambda _: ticket.release())
+    return StreamingResponse(stream.frames(), media_type="application/x-ndjson")
+
+
+@api.get("/chats/{chat_id}/stream", operation_id="chat_stream")
+async def resume_chat_stream(
+    chat_id: str = Depends(valid_chat_id),
+    after: int = Query(0, ge=0),
+    current_user=Depends(get_current_user),
+):
+    """Reattach to a chat's in-progress (or just finished) reply, replaying frames numbered above `after`"""
+    stream = reply_streams.get(chat_id)
+    if not stream or stream.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="No reply stream for this chat")
+    if not stream.can_resume(after):
+        raise HTTPException(status_code=410, detail="Requested frames are no longer buffered")
 
-    return StreamingResponse(generate(), media_type="application/x-ndjson")
+    return StreamingResponse(stream.frames(after), media_type="application/x-ndjson")
@@ -0,0 +1,32 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+from fastapi import Depends, HTTPException
+from api import api
+from auth import get_current_user
+from models import get_usage_db, TokenUsage, UsageSchema
+from models.storage import UsageStore
+
+USAGE_DEFAULT_DAYS = 30
+USAGE_MAX_DAYS = 366
+
+
+@api.get("/usage", response_model=UsageSchema, operation_id="usage_get")
+async def get_usage(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user=Depends(get_current_user),
+    usage_service: UsageStore = Depends(get_usage_db),
+):
+    """Get the current user's token usage per UTC day, from start to end inclusive (default: last 30 days)"""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=USAGE_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= USAGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {USAGE_MAX_DAYS} days")
+
+    days = await usage_service.get_daily_usage(current_user.id, start, end)
+    total = TokenUsage(**{
+        field: sum(getattr(day, field) for day in days) for field in TokenUsage.model_fields
+    })
+    return {"days": days, "total": total}
@@ -1,12 +1,14 @@
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-import httpx
 from authlib.integrations.starlette_client import OAuth
 from fastapi import HTTPException, Depends, Request
 from jose import JWTError, jwt
+from cache import principal_cache
+from http_clients import oauth_pool
 from models import get_db, User
-from models.bigtable_user import BigtableUserService
+from models.storage import UserStore
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = "HS256"
@@ -18,16 +20,52 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
     raise ValueError("GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET must be set")
 
+# authlib keeps Google's discovery document, and the JWKS once fetched, for
+# the life of the process; load_google_metadata() expires them after this
+OAUTH_METADATA_TTL_SECONDS = float(os.getenv("OAUTH_METADATA_TTL_SECONDS", "3600"))
+# Google issues ID tokens with either form of its issuer
+GOOGLE_ISSUERS = ["https://accounts.google.com", "accounts.google.com"]
+
 oauth = OAuth()
 oauth.register(
     name="google",
     client_id=GOOGLE_CLIENT_ID,
     client_secret=GOOGLE_CLIENT_SECRET,
     server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
+    # Every authlib request (discovery, JWKS, token exchange) goes through the shared pool
+    client_kwargs={"scope": "openid email profile", "transport": oauth_pool},
 )
 
 
+async def load_google_metadata() -> dict:
+    """Google's OpenID discovery document, refetched once it is older than the TTL"""
+    metadata = oauth.google.server_metadata
+    loaded_at = metadata.get("_loaded_at")
+    if loaded_at is not None and time.time() - loaded_at >= OAUTH_METADATA_TTL_SECONDS:
+        # Dropping these makes authlib fetch the document, and later the JWKS, again
+        metadata.pop("_loaded_at", None)
+        metadata.pop("jwks", None)
+    return await oauth.google.load_server_metadata()
+
+
+async def fetch_google_user_info(code: str, redirect_uri: str) -> dict:
+    """Exchange an authorization code for the signed-in user's Google claims.
+
+    The claims come from the ID token in the token response, verified against
+    the cached JWKS, which saves a userinfo request per login. The userinfo
+    endpoint is only called if Google sent no ID token.
+    """
+    await load_google_metadata()
+    token = await oauth.google.fetch_access_token(code=code, redirect_uri=redirect_uri)
+    if "id_token" in token:
+        claims = await oauth.google.parse_id_token(
+            token, nonce=None, claims_options={"iss": {"values": GOOGLE_ISSUERS}}
+        )
+    else:
+        claims = await oauth.google.userinfo(token=token)
+    return dict(claims)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -40,7 +78,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 async def get_current_user(
-    request: Request, db_service: BigtableUserService = Depends(get_db)
+    request: Request, db_service: UserStore = Depends(get_db)
 ):
     credentials_exception = HTTPException(
         status_code=401,
@@ -61,6 +99,11 @@ async def get_current_user(
         if not token:
             raise credentials_exception
 
+    # A token that verified recently skips JWT decoding and the user read
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -69,13 +112,15 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db_service.get_user_by_id(int(user_id))
+    user = await db_service.get_user_by_id(int(user_id))
     if user is None:
         raise credentials_exception
+
+    principal_cache.put(token, user, payload["exp"])
     return user
 
 
-async def get_or_create_user(user_info: dict, db_service: BigtableUserService) -> User:
+async def get_or_create_user(user_info: dict, db_service: UserStore) -> User:
     google_id = user_info.get("sub")
     email = user_info.get("email")
     name = user_info.get("name") or user_info.get("given_name", "")
@@ -89,14 +134,14 @@ async def get_or_create_user(user_info: dict, db_service: BigtableUserService) -
     if not name:
         name = email.split("@")[0]
 
-    user = db_service.get_user_by_google_id(google_id)
+    user = await db_service.get_user_by_google_id(google_id)
 
     if not user:
-        user = db_service.create_user(
+        user = await db_service.create_user(
             name=name, email=email, google_id=google_id, picture=picture
         )
     else:
         if user.name != name or user.picture != picture:
-            user = db_service.update_user(user.id, name=name, picture=picture)
+            user = await db_service.update_user(user.id, name=name, picture=picture)
 
     return user
@@ -1,65 +1,294 @@
+import asyncio
+import base64
+import binascii
+import functools
+import inspect
+import itertools
 import os
+import threading
+import time
+import zlib
+from datetime import datetime
 from google.cloud import bigtable
-from typing import Optional
+from google.cloud.bigtable.data import (
+    BigtableDataClientAsync,
+    ReadRowsQuery,
+    RowMutationEntry,
+    RowRange,
+    SetCell,
+    TableAsync,
+)
+from google.cloud.bigtable.data.row import Row
+from typing import Any, Coroutine, Dict, List, Optional, Tuple
 
-PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 BIGTABLE_INSTANCE_ID = os.getenv("BIGTABLE_INSTANCE_ID", "chatssi-csdb")
 BIGTABLE_TABLE_ID = os.getenv("BIGTABLE_TABLE_ID", "users")
+# The emulator accepts any project id
+EMULATOR_PROJECT_ID = "emulator"
 
-if not PROJECT_ID:
-    raise ValueError("GOOGLE_CLOUD_PROJECT environment variable must be set")
 
-# Initialize Bigtable client
-client = bigtable.Client(project=PROJECT_ID)
-instance = client.instance(BIGTABLE_INSTANCE_ID)
-table = instance.table(BIGTABLE_TABLE_ID)
+def get_project_id() -> str:
+    """GCP project for the Bigtable clients, read when the first client is created.
+
+    Clients are created lazily so the module imports without GCP settings,
+    which the in-memory storage backend never needs.
+    """
+    project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
+    if not project_id and os.getenv("BIGTABLE_EMULATOR_HOST"):
+        project_id = EMULATOR_PROJECT_ID
+    if not project_id:
+        raise ValueError("GOOGLE_CLOUD_PROJECT environment variable must be set")
+    return project_id
 
 # Column family names
 USER_DATA_FAMILY = "user_data"
 METADATA_FAMILY = "metadata"
 CHAT_DATA_FAMILY = "chat_data"
 MESSAGE_DATA_FAMILY = "message_data"
+# Counter cells (token usage, chat list versions), only ever written with read-modify-write increments
+USAGE_FAMILY = "usage"
+
 
+# Number of async data clients (each with its own gRPC channel) that requests
+# are spread across. One channel multiplexes many RPCs, but a single HTTP/2
+# connection caps concurrent streams, so busy workers want a few.
+BIGTABLE_CHANNEL_POOL_SIZE = int(os.getenv("BIGTABLE_CHANNEL_POOL_SIZE", "4"))
 
+
+@functools.lru_cache(maxsize=None)
 def get_bigtable_client():
     """Get Bigtable client instance"""
-    return client
+    return bigtable.Client(project=get_project_id())
 
 
 def get_users_table():
     """Get users table instance"""
-    return table
+    return get_bigtable_client().instance(BIGTABLE_INSTANCE_ID).table(BIGTABLE_TABLE_ID)
+
+
+class _AsyncTablePool:
+    """Round-robin pool of async table handles, one data client per channel"""
+
+    def __init__(self, size: int):
+        project_id = get_project_id()
+        self.clients = [BigtableDataClientAsync(project=project_id) for _ in range(size)]
+        self.tables = [c.get_table(BIGTABLE_INSTANCE_ID, BIGTABLE_TABLE_ID) for c in self.clients]
+        self._next = itertools.cycle(self.tables)
+
+    def get_table(self) -> TableAsync:
+        return next(self._next)
+
+    async def close(self):
+        for c in self.clients:
+            await c.close()
+
+
+# Async clients are bound to the event loop that created them, so the pool is
+# kept per loop: the server's loop, and the loop behind the sync facades.
+_async_table_pools: Dict[asyncio.AbstractEventLoop, _AsyncTablePool] = {}
+
+
+def get_async_table() -> TableAsync:
+    """Get an async users table handle from the current event loop's channel pool"""
+    loop = asyncio.get_running_loop()
+    pool = _async_table_pools.get(loop)
+    if pool is None:
+        pool = _async_table_pools[loop] = _AsyncTablePool(BIGTABLE_CHANNEL_POOL_SIZE)
+    return pool.get_table()
+
+
+async def close_async_tables():
+    """Close the current event loop's channel pool"""
+    pool = _async_table_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+# Row keys that would otherwise start with a time-ordered ID get a salt in
+# front of it, so new rows spread over this many key ranges (and tablets)
+# instead of all landing at the end of the table
+KEY_SALT_BUCKETS = 64
+
+
+def key_salt(value: Any) -> str:
+    """Stable two-digit bucket for a key component, the same in every process"""
+    return f"{zlib.crc32(str(value).encode('utf-8')) % KEY_SALT_BUCKETS:02d}"
+
+
+def prefix_range(prefix: str) -> RowRange:
+    """Row range covering every key that starts with prefix"""
+    end_key = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return RowRange(start_key=prefix, end_key=end_key)
+
+
+def encode_cursor(row_key: bytes) -> str:
+    """Opaque page cursor for the row a page ended on"""
+    return base64.urlsafe_b64encode(row_key).decode("ascii")
+
+
+def decode_cursor(cursor: str, prefix: str) -> str:
+    """Row key a cursor points at; ValueError unless it is valid and within prefix"""
+    try:
+        row_key = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not row_key.startswith(prefix):
+        raise ValueError("Invalid cursor")
+    return row_key
+
+
+def page_range(prefix: str, cursor: Optional[str] = None) -> RowRange:
+    """Row range for the page after cursor within prefix.
+
+    Cursors are client-supplied, so one that decodes outside prefix (for
+    example into another user's rows) is rejected with ValueError.
+    """
+    full_range = prefix_range(prefix)
+    if cursor is None:
+        return full_range
+
+    after_key = decode_cursor(cursor, prefix)
+    return RowRange(start_key=after_key, end_key=full_range.end_key, start_is_inclusive=False)
+
+
+async def read_page(prefix: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+    """Read up to limit rows under prefix after cursor, plus the next page's cursor"""
+    # One extra row tells us whether there is a next page without a second RPC
+    query = ReadRowsQuery(row_ranges=page_range(prefix, cursor), limit=limit + 1)
+    rows = await get_async_table().read_rows(query)
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].row_key)
+
+
+def row_counters(row: Row) -> Dict[str, int]:
+    """Column qualifier -> value for counter cells (64-bit big-endian integers)"""
+    return {
+        cell.qualifier.decode("utf-8"): int.from_bytes(cell.value, "big", signed=True)
+        for cell in row.cells
+    }
+
+
+def row_values(row: Row) -> Dict[str, str]:
+    """Latest value of each column in a row, keyed by qualifier (family dropped)"""
+    values = {}
+    for cell in row.cells:
+        qualifier = cell.qualifier.decode("utf-8")
+        # Cells for a column arrive newest first
+        if qualifier not in values:
+            values[qualifier] = cell.value.decode("utf-8")
+    return values
+
+
+async def commit_rows(entries: List[RowMutationEntry]):
+    """Apply a batch of row mutations in one MutateRows RPC"""
+    if entries:
+        await get_async_table().bulk_mutate_rows(entries)
+
+
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """Run a coroutine to completion from synchronous code.
+
+    Coroutines run on one long-lived background loop so its channel pool is
+    reused between calls.
+    """
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="bigtable-sync", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
+
+
+class SyncServiceFacade:
+    """Blocking wrapper exposing every coroutine method of an async service"""
+
+    async_service_class: type
+
+    def __init__(self):
+        self._service = self.async_service_class()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._service, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def blocking(*args, **kwargs):
+            return run_sync(attr(*args, **kwargs))
+
+        return blocking
+
+
+# Online migrations write a marker row once they finish; readers keep their
+# compatibility path until they see it. Markers are re-checked at most once
+# per interval so a finished migration costs nothing on the hot path.
+MIGRATION_CHECK_INTERVAL_SECONDS = 60
+_migration_state: Dict[str, Tuple[bool, float]] = {}
+
+
+def _migration_row_key(name: str) -> str:
+    return f"migration#{name}"
+
+
+async def is_migration_complete(name: str) -> bool:
+    """Whether the named migration has finished, cached per process"""
+    done, checked_at = _migration_state.get(name, (False, 0.0))
+    if done:
+        return True
+
+    now = time.monotonic()
+    if now - checked_at >= MIGRATION_CHECK_INTERVAL_SECONDS:
+        done = await get_async_table().row_exists(_migration_row_key(name))
+        _migration_state[name] = (done, now)
+    return done
+
+
+async def mark_migration_complete(name: str):
+    """Record that the named migration has finished"""
+    await get_async_table().mutate_row(
+        _migration_row_key(name),
+        SetCell(METADATA_FAMILY, "completed_at", datetime.utcnow().isoformat()),
+    )
+    _migration_state[name] = (True, time.monotonic())
 
 
 async def ensure_table_exists():
     """Ensure the users table and column families exist"""
     try:
         # Use admin client for table operations
-        admin_client = bigtable.Client(project=PROJECT_ID, admin=True)
+        admin_client = bigtable.Client(project=get_project_id(), admin=True)
         admin_instance = admin_client.instance(BIGTABLE_INSTANCE_ID)
         admin_table = admin_instance.table(BIGTABLE_TABLE_ID)
 
-        if not admin_table.exists():
-            # Create table with column families
-            from google.cloud.bigtable import column_family
-
-            # Create column families with max versions = 1
-            user_data_cf = column_family.MaxVersionsGCRule(1)
-            metadata_cf = column_family.MaxVersionsGCRule(1)
-            chat_data_cf = column_family.MaxVersionsGCRule(1)
-            message_data_cf = column_family.MaxVersionsGCRule(1)
-
-            column_families = {
-                USER_DATA_FAMILY: user_data_cf,
-                METADATA_FAMILY: metadata_cf,
-                CHAT_DATA_FAMILY: chat_data_cf,
-                MESSAGE_DATA_FAMILY: message_data_cf,
-            }
+        from google.cloud.bigtable import column_family
+
+        # Column families with max versions = 1
+        column_families = {
+            USER_DATA_FAMILY: column_family.MaxVersionsGCRule(1),
+            METADATA_FAMILY: column_family.MaxVersionsGCRule(1),
+            CHAT_DATA_FAMILY: column_family.MaxVersionsGCRule(1),
+            MESSAGE_DATA_FAMILY: column_family.MaxVersionsGCRule(1),
+            USAGE_FAMILY: column_family.MaxVersionsGCRule(1),
+        }
 
+        if not admin_table.exists():
             admin_table.create(column_families=column_families)
             print(f"Created Bigtable table '{BIGTABLE_TABLE_ID}'")
         else:
             print(f"Bigtable table '{BIGTABLE_TABLE_ID}' already exists")
+            # Add families introduced since the table was created
+            existing = admin_table.list_column_families()
+            for name, gc_rule in column_families.items():
+                if name not in existing:
+                    admin_table.column_family(name, gc_rule).create()
+                    print(f"Added column family '{name}'")
 
     except Exception as e:
         print(f"Error ensuring table exists: {e}")
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from models.chat import ChatMessage
+    from models.user import User
+
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
+
+class PrincipalCache:
+    """Bounded LRU cache of verified access tokens and the User they resolve to.
+
+    Entries are keyed by a hash of the token, so raw tokens are never kept in
+    memory, and expire after the TTL or at the token's own exp, whichever
+    comes first. Writes through the user service invalidate a user's entries
+    in this process; other workers see changes once their entries expire.
+    """
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[str]] = {}
+        # The sync service facades invalidate from their own thread
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional["User"]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            user, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: "User", token_exp: float):
+        """Cache a verified token until min(now + TTL, the token's exp)"""
+        expires_at = min(time.time() + self.ttl_seconds, token_exp)
+        key = self._key(token)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user, expires_at)
+            self._keys_by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._entries.pop(key, None)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._keys_by_user.get(entry[0].id)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[entry[0].id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache()
+
+
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Rough per-message cost of the ChatMessage object itself, on top of its text
+MESSAGE_OVERHEAD_BYTES = 256
+
+
+class HistoryCache:
+    """LRU of per-chat message history, bounded by an approximate byte budget.
+
+    Each entry remembers the chat's updated_at as of the last write or load
+    seen by this process. Readers pass the chat's current updated_at, so a
+    message written by another worker makes the entry stale instead of
+    silently serving an incomplete history. Writers pass the updated_at they
+    last saw for the chat, and an entry that doesn't match it is dropped
+    rather than extended, since it is missing whatever was written between.
+    Updates are blind writes, so one that lands between a reply's own two
+    writes (another worker replying in the same chat) still goes unnoticed.
+    """
+
+    def __init__(self, max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[list, datetime, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _message_size(message: "ChatMessage") -> int:
+        return len(message.content) + MESSAGE_OVERHEAD_BYTES
+
+    def get(self, chat_id: str, updated_at: Optional[datetime]) -> Optional[List["ChatMessage"]]:
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None or entry[1] != updated_at:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return list(entry[0])
+
+    def put(self, chat_id: str, messages: List["ChatMessage"], updated_at: Optional[datetime]):
+        """Cache a chat's full history as loaded from (or just created in) storage"""
+        size = sum(self._message_size(m) for m in messages)
+        with self._lock:
+            self._remove(chat_id)
+            if size > self.max_bytes:
+                return
+            self._entries[chat_id] = (list(messages), updated_at, size)
+            self.bytes += size
+            self._evict()
+
+    def append(self, chat_id: str, message: "ChatMessage", updated_at: Optional[datetime],
+               previous_updated_at: Optional[datetime]):
+        """Write-through for a new message; chats that aren't cached stay uncached.
+
+        previous_updated_at is the chat's updated_at the writer saw before this write.
+        """
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return
+            if entry[1] != previous_updated_at:
+                self._remove(chat_id)
+                return
+
+            messages, _, size = entry
+            messages.append(message)
+            added = self._message_size(message)
+            self._entries[chat_id] = (messages, updated_at, size + added)
+            self._entries.move_to_end(chat_id)
+            self.bytes += added
+            self._evict()
+
+    def invalidate(self, chat_id: str):
+        with self._lock:
+            self._remove(chat_id)
+
+    def _remove(self, chat_id: str):
+        entry = self._entries.pop(chat_id, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,84 @@
+"""Build the model request for a chat turn from its stored history.
+
+The history sent to the model is bounded by a token budget: once a chat
+outgrows it, whole turns are dropped from the oldest end. The cut point
+moves in steps of CONTEXT_TRIM_STEP messages rather than one turn at a
+time, so consecutive requests share the same prefix and keep hitting the
+prompt cache until the next step is taken.
+
+A cache breakpoint is placed on the last message before the new user turn,
+which is the longest prefix the next request is guaranteed to repeat.
+"""
+import os
+from typing import List, Optional, Tuple
+
+from models.chat import ChatMessage
+
+# Tokens of history (plus the new message) sent with each request
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "100000"))
+# Number of messages the trimmed prefix is rounded to
+CONTEXT_TRIM_STEP = int(os.getenv("CONTEXT_TRIM_STEP", "20"))
+# Prefixes shorter than this are below the model's minimum cacheable length
+MIN_CACHEABLE_TOKENS = 1024
+# Per-message framing the API adds around each turn
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRIMMED_HISTORY_NOTE = "Earlier turns of this conversation were omitted to fit the context window."
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-ish estimate (about four characters per token) that needs no API call"""
+    return len(text) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def _trim_start(sizes: List[int], budget: int, step: int) -> int:
+    """Index of the first history message to keep so the rest fits the budget"""
+    total = sum(sizes)
+    start = 0
+    while total > budget and start < len(sizes):
+        total -= sizes[start]
+        start += 1
+
+    if start == 0:
+        return 0
+    # Round up to the step so the cut only moves every `step` messages
+    return min(-(-start // step) * step, len(sizes))
+
+
+def build_context(
+    history: List[ChatMessage],
+    user_message: str,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    step: int = CONTEXT_TRIM_STEP,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return (messages, system) for a request that appends user_message to history.
+
+    history is the chat's stored messages oldest first, alternating user and
+    assistant turns. system is None unless older turns had to be dropped.
+    Messages with empty content, which the API rejects, are left out; the
+    API joins the consecutive user turns that can leave behind.
+    """
+    history = [m for m in history if m.content]
+    new_turn_tokens = estimate_tokens(user_message)
+    sizes = [estimate_tokens(m.content) for m in history]
+    start = _trim_start(sizes, max(budget - new_turn_tokens, 0), step)
+    # The first message sent must be a user turn
+    while start < len(history) and history[start].message_type != "user":
+        start += 1
+
+    messages = [
+        {"role": "user" if m.message_type == "user" else "assistant", "content": m.content}
+        for m in history[start:]
+    ]
+    system = TRIMMED_HISTORY_NOTE if start else None
+
+    if messages and sum(sizes[start:]) >= MIN_CACHEABLE_TOKENS:
+        last = messages[-1]
+        last["content"] = [{
+            "type": "text",
+            "text": last["content"],
+            "cache_control": {"type": "ephemeral"},
+        }]
+
+    messages.append({"role": "user", "content": user_message})
+    return messages, system
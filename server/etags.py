@@ -0,0 +1,18 @@
+"""ETags and If-None-Match checks for conditional GETs"""
+import hashlib
+
+# Browsers may store the response but must revalidate it (If-None-Match) before every use
+REVALIDATE_CACHE_CONTROL = "no-cache"
+PRIVATE_REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts) -> str:
+    """A weak ETag naming the version of a JSON representation built from parts"""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match uses"""
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
@@ -0,0 +1,69 @@
+"""Outbound HTTP connection pools, one per upstream, kept for the app's lifetime.
+
+A pool is a single httpx transport (keep-alive, HTTP/2) that any number of
+clients can borrow by passing it as their transport, so a login reuses the
+TLS connections the previous login opened instead of handshaking again.
+Clients closing themselves leave the pool open; the lifespan in main.py
+closes the pools at shutdown.
+
+OAuth (Google discovery, JWKS and token exchange) and the Anthropic API get
+separate pools with the same settings, so long-running reply streams never
+hold connections a login is waiting for.
+"""
+import os
+from typing import List, Optional
+
+import httpx
+
+# Needs the h2 package (httpx[http2]); set OUTBOUND_HTTP2=0 to use HTTP/1.1 only
+OUTBOUND_HTTP2 = os.getenv("OUTBOUND_HTTP2", "1") != "0"
+OUTBOUND_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OUTBOUND_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+OAUTH_MAX_CONNECTIONS = int(os.getenv("OAUTH_MAX_CONNECTIONS", "100"))
+OAUTH_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OAUTH_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# Each reply stream holds a connection (or an HTTP/2 stream) for its whole
+# duration, so this bounds how many replies a worker can stream at once
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "2000"))
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "200"))
+
+
+class ConnectionPool(httpx.AsyncBaseTransport):
+    """Shared transport that clients can close without closing the connections"""
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=OUTBOUND_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        self._transport: Optional[httpx.AsyncBaseTransport] = None
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        # Created on first use, and again after close(), so the pool outlives a lifespan restart
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport(http2=OUTBOUND_HTTP2, limits=self.limits)
+        return self._transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        # Called by every borrowing client on exit; the pool is closed by close()
+        pass
+
+    async def close(self):
+        if self._transport is not None:
+            transport, self._transport = self._transport, None
+            await transport.aclose()
+
+
+oauth_pool = ConnectionPool(OAUTH_MAX_CONNECTIONS, OAUTH_MAX_KEEPALIVE_CONNECTIONS)
+anthropic_pool = ConnectionPool(ANTHROPIC_MAX_CONNECTIONS, ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS)
+_pools: List[ConnectionPool] = [oauth_pool, anthropic_pool]
+
+
+async def close_connection_pools():
+    for pool in _pools:
+        await pool.close()
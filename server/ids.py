@@ -0,0 +1,84 @@
+"""Unique, time-ordered integer IDs for users, messages and server-made chats.
+
+IDs are snowflake-style: milliseconds since the Unix epoch, then a worker
+number, then a per-millisecond sequence:
+
+    id = milliseconds << 10 | worker << 5 | sequence
+
+so two IDs from one process never collide, and processes with different
+worker numbers can't collide with each other. Set WORKER_ID (0-31) per
+process where that matters (several instances of the server); otherwise it
+is derived from the hostname and pid, which keeps uvicorn's worker
+processes on one host apart but gives no such promise across hosts (in
+containers the pid is usually 1). User creation writes insert-if-absent
+and retries with a new ID, so a repeat there costs an attempt, not an account.
+
+IDs stay below 2**53 (until the year 2248) so they survive a round trip
+through JSON in the browser, and every ID is larger than the microsecond
+timestamps used as IDs before, so new messages still sort after old ones.
+"""
+import os
+import socket
+import threading
+import time
+import zlib
+from typing import Optional
+
+WORKER_ID_BITS = 5
+SEQUENCE_BITS = 5
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def default_worker_id() -> int:
+    """WORKER_ID if set, otherwise a number derived from the host and process"""
+    worker_id = os.getenv("WORKER_ID")
+    if worker_id is not None:
+        worker_id = int(worker_id)
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"WORKER_ID must be between 0 and {MAX_WORKER_ID}")
+        return worker_id
+    # Sibling worker processes get consecutive-ish pids, so keep the pid in the low bits
+    return (zlib.crc32(socket.gethostname().encode("utf-8")) + os.getpid()) & MAX_WORKER_ID
+
+
+class IdGenerator:
+    """Thread-safe snowflake-style ID source for one process"""
+
+    def __init__(self, worker_id: Optional[int] = None):
+        self.worker_id = default_worker_id() if worker_id is None else worker_id
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            # Never step backwards if the wall clock does
+            ms = max(time.time_ns() // 1_000_000, self._last_ms)
+            if ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Sequence exhausted: borrow the next millisecond rather than wait for it
+                    ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = ms
+            return ms << (WORKER_ID_BITS + SEQUENCE_BITS) | self.worker_id << SEQUENCE_BITS | self._sequence
+
+
+id_generator = IdGenerator()
+
+
+def _reset_after_fork():
+    # A forked child would otherwise share its parent's worker number and sequence
+    global id_generator
+    id_generator = IdGenerator()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def next_id() -> int:
+    """A new unique ID from this process's generator"""
+    return id_generator.next_id()
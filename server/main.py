@@ -9,19 +9,40 @@ from pydantic import BaseModel
 from api import api
 import os
 
-from bigtable_client import ensure_table_exists
-from fastapi import FastAPI
+from http_clients import close_connection_pools
+from models.storage import close_storage, open_storage
+from spa import CLIENT_DIST_DIR, SpaFiles
+from fastapi import FastAPI, Response
+import metrics
 
 
-# Initialize Bigtable on startup
+# Initialize storage on startup; close it and the outbound connection pools on shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await ensure_table_exists()
+    await open_storage()
     yield
+    await close_storage()
+    await close_connection_pools()
 
 app = FastAPI(lifespan=lifespan)
 
 # Add session middleware for OAuth
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "your-secret-key-change-this"))
 
-app.include_router(api)
+if CLIENT_DIST_DIR:
+    # Serving the client too: the API moves under /api, as the Vite dev server proxies it
+    app.include_router(api, prefix="/api")
+else:
+    app.include_router(api)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+if CLIENT_DIST_DIR:
+    # Last, so every route above takes precedence over the client's files
+    app.mount("/", SpaFiles(CLIENT_DIST_DIR), name="client")
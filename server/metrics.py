@@ -0,0 +1,163 @@
+"""Prometheus metrics for the chat hot path, served at GET /metrics.
+
+Everything here is cheap enough to leave on: histograms are observed
+through pre-bound label children, and cache and stream counters that the
+code already keeps are only read when the endpoint is scraped.
+"""
+import functools
+import inspect
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Bigtable RPCs are single-digit milliseconds when healthy
+STORAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0)
+TOKEN_GAP_BUCKETS = (0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 30, 40, 50, 60, 80, 100, 150, 200)
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+storage_call_seconds = Histogram(
+    "storage_call_seconds",
+    "Latency of storage service methods",
+    ["service", "method"],
+    buckets=STORAGE_BUCKETS,
+)
+reply_time_to_first_token_seconds = Histogram(
+    "chat_reply_time_to_first_token_seconds",
+    "Time from sending the model request to the first text delta",
+    buckets=TTFT_BUCKETS,
+)
+reply_inter_token_seconds = Histogram(
+    "chat_reply_inter_token_seconds",
+    "Gap between consecutive text deltas of a reply",
+    buckets=TOKEN_GAP_BUCKETS,
+)
+reply_tokens_per_second = Histogram(
+    "chat_reply_tokens_per_second",
+    "Output tokens per second of a finished reply, after its first token",
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+reply_queue_wait_seconds = Histogram(
+    "chat_reply_queue_wait_seconds",
+    "Time from admitting a reply to granting it a stream slot",
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+replies_in_flight = Gauge("chat_replies_in_flight", "Replies currently being generated")
+reply_readers = Gauge("chat_reply_readers", "Client connections currently reading a reply stream")
+
+
+def instrumented(service: str):
+    """Class decorator timing every public coroutine method of a storage service"""
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(method):
+                continue
+            setattr(cls, name, _timed(storage_call_seconds.labels(service, name), method))
+        return cls
+    return decorate
+
+
+def _timed(histogram, method):
+    @functools.wraps(method)
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return timed
+
+
+class ReplyTimer:
+    """Per-reply token timing, fed one text delta at a time"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+
+    def token(self):
+        now = time.perf_counter()
+        if self.last_token_at is None:
+            self.first_token_at = now
+            reply_time_to_first_token_seconds.observe(now - self.started)
+        else:
+            reply_inter_token_seconds.observe(now - self.last_token_at)
+        self.last_token_at = now
+
+    def finish(self, output_tokens: int):
+        if self.first_token_at is not None and self.last_token_at > self.first_token_at:
+            reply_tokens_per_second.observe(output_tokens / (self.last_token_at - self.first_token_at))
+
+
+class _StatsCollector:
+    """Exposes the counters the caches, read coalescing, stream registry and scheduler keep, read at scrape time"""
+
+    def describe(self):
+        # Registering would otherwise call collect(), importing modules that import this one
+        return []
+
+    def collect(self):
+        from admission import reply_scheduler
+        from cache import history_cache, principal_cache
+        from singleflight import chat_reads, user_reads
+        from streams import reply_streams
+
+        for name, cache in (("principal", principal_cache), ("history", history_cache)):
+            stats = cache.stats()
+            hits = CounterMetricFamily(f"{name}_cache_hits", f"{name.capitalize()} cache hits")
+            hits.add_metric([], stats["hits"])
+            misses = CounterMetricFamily(f"{name}_cache_misses", f"{name.capitalize()} cache misses")
+            misses.add_metric([], stats["misses"])
+            entries = GaugeMetricFamily(f"{name}_cache_entries", f"Entries in the {name} cache")
+            entries.add_metric([], stats["entries"])
+            yield from (hits, misses, entries)
+
+        calls = CounterMetricFamily("storage_reads", "Coalescable storage reads requested", labels=["service"])
+        saved = CounterMetricFamily(
+            "storage_reads_coalesced", "Reads that joined an identical one in flight (RPCs saved)", labels=["service"],
+        )
+        for service, flight in (("chat", chat_reads), ("user", user_reads)):
+            stats = flight.stats()
+            calls.add_metric([service], stats["calls"])
+            saved.add_metric([service], stats["coalesced"])
+        yield from (calls, saved)
+
+        stats = reply_streams.stats()
+        for key, help_text in (
+            ("abandoned", "Replies cancelled after every reader went away"),
+            ("abandoned_output_deltas", "Text deltas abandoned replies had streamed when cancelled"),
+            ("abandoned_seconds", "Seconds abandoned replies had run when cancelled"),
+        ):
+            metric = CounterMetricFamily(f"chat_replies_{key}", help_text)
+            metric.add_metric([], stats[key])
+            yield metric
+
+        stats = reply_scheduler.stats()
+        for key, help_text in (
+            ("in_flight", "Replies holding a stream slot"),
+            ("max_in_flight", "Stream slots per worker"),
+            ("queued", "Replies waiting for a stream slot"),
+            ("queued_users", "Users with replies waiting for a stream slot"),
+        ):
+            metric = GaugeMetricFamily(f"chat_scheduler_{key}", help_text)
+            metric.add_metric([], stats[key])
+            yield metric
+        for key, help_text in (
+            ("admitted", "Replies admitted by the scheduler"),
+            ("rejected_rate_limited", "Replies refused because the user was over their rate limit"),
+            ("rejected_queue_full", "Replies refused because the scheduler queue was full"),
+        ):
+            metric = CounterMetricFamily(f"chat_scheduler_{key}", help_text)
+            metric.add_metric([], stats[key])
+            yield metric
+
+
+REGISTRY.register(_StatsCollector())
+
+
+def render():
+    """The default registry in Prometheus text format, with its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
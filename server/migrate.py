@@ -0,0 +1,52 @@
+"""Online data migrations for the Bigtable schema.
+
+Usage (from the server/ directory):
+
+    uv run python migrate.py messages
+    uv run python migrate.py chat-index
+    uv run python migrate.py user-lookups
+    uv run python migrate.py user-keys
+"""
+import argparse
+
+from models.bigtable_chat import BigtableChatService
+from models.bigtable_user import BigtableUserService
+
+
+def migrate_messages():
+    moved = BigtableChatService().migrate_legacy_messages()
+    print(f"Moved {moved} message rows to chat-scoped keys")
+
+
+def migrate_chat_index():
+    indexed = BigtableChatService().backfill_user_chat_index()
+    print(f"Indexed {indexed} chats by user")
+
+
+def migrate_user_lookups():
+    visited = BigtableUserService().backfill_user_lookups()
+    print(f"Backfilled lookup rows for {visited} users")
+
+
+def migrate_user_keys():
+    moved = BigtableUserService().migrate_user_keys()
+    print(f"Moved {moved} user rows to salted keys")
+
+
+MIGRATIONS = {
+    "messages": migrate_messages,
+    "chat-index": migrate_chat_index,
+    "user-lookups": migrate_user_lookups,
+    "user-keys": migrate_user_keys,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    args = parser.parse_args()
+    MIGRATIONS[args.migration]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 from .user import User, UserSchema, UserCreate
-from .chat import Chat, ChatSchema, ChatCreate, ChatMessage, ChatMessageSchema, ChatMessageCreate
-from .bigtable_user import BigtableUserService
-from .bigtable_chat import BigtableChatService
+from .chat import (
+    Chat, ChatSchema, ChatCreate, ChatMessage, ChatMessageSchema, ChatMessageCreate,
+    ChatSummarySchema, ChatListSchema, ChatDetailSchema,
+)
+from .usage import TokenUsage, DailyUsageSchema, UsageSchema
+from .bigtable_user import AsyncBigtableUserService, BigtableUserService
+from .bigtable_chat import AsyncBigtableChatService, BigtableChatService
+from .bigtable_usage import AsyncBigtableUsageService, BigtableUsageService
+from .memory import MemoryChatService, MemoryUserService, MemoryUsageService
+from .storage import ChatStore, UserStore, UsageStore, chat_store, user_store, usage_store
 
-# For backward compatibility during migration
-get_db = lambda: BigtableUserService()
-get_chat_db = lambda: BigtableChatService()
\ No newline at end of file
+# Request handlers use the async services of the configured backend; the
+# blocking Bigtable ones are for scripts
+get_db = user_store
+get_chat_db = chat_store
+get_usage_db = usage_store
\ No newline at end of file
@@ -1,99 +1,252 @@
 import json
-from datetime import datetime
-from typing import Optional, List, Dict, Any
-from google.cloud.bigtable.row import DirectRow
-from google.cloud.bigtable.row_filters import FamilyNameRegexFilter, ColumnQualifierRegexFilter
-from bigtable_client import get_users_table, CHAT_DATA_FAMILY, MESSAGE_DATA_FAMILY, METADATA_FAMILY
-from .chat import Chat, ChatMessage
-
-class BigtableChatService:
-    """Service class for chat operations with Bigtable"""
-    
-    def __init__(self):
-        self.table = get_users_table()
-    
-    def _row_to_chat(self, row_key: str, row_data: Dict[str, Any]) -> Chat:
-        """Convert Bigtable row data to Chat object"""
-        chat_data = {}
-        
-        # Parse row data similar to user parsing
-        for full_column_name, cell_list in row_data.items():
-            if isinstance(full_column_name, bytes):
-                full_column_name = full_column_name.decode('utf-8')
-            
-            if cell_list and isinstance(cell_list, list) and cell_list:
-                cell = cell_list[0]
-                value = cell.value
-                if isinstance(value, bytes):
-                    value = value.decode('utf-8')
-                
-                clean_column = full_column_name.split(':')[-1]
-                chat_data[clean_column] = value
-        
+import struct
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+from google.cloud.bigtable.data import DeleteAllFromRow, ReadRowsQuery, RowMutationEntry, SetCell
+from google.cloud.bigtable.data.row import Row
+from google.cloud.bigtable.data.read_modify_write_rules import IncrementRule
+from google.cloud.bigtable.data.row_filters import FamilyNameRegexFilter
+import zstandard
+from bigtable_client import (
+    commit_rows,
+    get_async_table,
+    is_migration_complete,
+    mark_migration_complete,
+    prefix_range,
+    read_page,
+    row_counters,
+    row_values,
+    SyncServiceFacade,
+    CHAT_DATA_FAMILY,
+    MESSAGE_DATA_FAMILY,
+    METADATA_FAMILY,
+    USAGE_FAMILY,
+)
+from metrics import instrumented
+from cache import history_cache
+from ids import next_id
+from singleflight import chat_reads, coalesced
+from .chat import Chat, ChatMessage, ChatMessageCreate
+from .usage import TokenUsage
+
+# Messages live next to their chat row so a chat's history is one contiguous,
+# chronologically ordered key range: chat#{chat_id}#msg#{zero-padded message id}
+MESSAGE_KEY_SEPARATOR = "#msg#"
+MESSAGE_ID_WIDTH = 20
+# Integer message columns: tokens_used and its breakdown
+MESSAGE_TOKEN_FIELDS = (
+    "tokens_used", "input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens",
+)
+
+# Messages are written as one packed cell: a fixed header (format version,
+# flags, user id, created_at in epoch microseconds, token counts with -1 for
+# none, string lengths) followed by the utf-8 message_type, model and content.
+# chat_id and id come from the row key. Older rows have one cell per field.
+PACKED_MESSAGE_COLUMN = "packed"
+PACKED_MESSAGE_VERSION = 1
+PACKED_MESSAGE_HEADER = struct.Struct(f">BBqq{len(MESSAGE_TOKEN_FIELDS)}qHHI")
+PACKED_TRUNCATED = 1
+PACKED_HAS_MODEL = 2
+PACKED_ZSTD_CONTENT = 4
+# Content at least this long (utf-8 bytes) is stored zstd-compressed, when that is smaller
+COMPRESS_CONTENT_MIN_BYTES = 512
+COMPRESS_CONTENT_LEVEL = 3
+
+# Rows written before the chat-scoped layout; see migrate_legacy_messages()
+LEGACY_MESSAGE_PREFIX = "message#"
+MESSAGE_MIGRATION = "message_keys"
+
+# Per-user chat index, newest chat first: uidx#{user_id}#{reverse created_at}#{chat_id}.
+# Index rows carry the listing fields so GET /chats never touches the chat rows.
+USER_CHAT_INDEX_MIGRATION = "user_chat_index"
+REVERSE_TIMESTAMP_MAX = 10**19 - 1
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Per-user counter bumped whenever the chat list's contents change (a chat
+# added or renamed), so GET /chats can answer If-None-Match from one row
+CHAT_LIST_VERSION_COLUMN = "chat_list_version"
+
+
+def chat_row_key(chat_id: str) -> str:
+    return f"chat#{chat_id}"
+
+
+def message_row_prefix(chat_id: str) -> str:
+    return f"{chat_row_key(chat_id)}{MESSAGE_KEY_SEPARATOR}"
+
+
+def message_row_key(chat_id: str, message_id: int) -> str:
+    return f"{message_row_prefix(chat_id)}{message_id:0{MESSAGE_ID_WIDTH}d}"
+
+
+def user_chat_index_prefix(user_id: int) -> str:
+    return f"uidx#{user_id}#"
+
+
+def user_chat_index_key(user_id: int, created_at: datetime, chat_id: str) -> str:
+    micros = (created_at - EPOCH) // MICROSECOND
+    return f"{user_chat_index_prefix(user_id)}{REVERSE_TIMESTAMP_MAX - micros:019d}#{chat_id}"
+
+
+def chat_list_version_key(user_id: int) -> str:
+    return f"chatver#{user_id}"
+
+
+def forget_chat_reads(chat_id: str):
+    """After writing a chat or its messages, start fresh reads of them"""
+    chat_reads.forget("get_chat_by_id", chat_id)
+    chat_reads.forget("get_messages_by_chat_id", chat_id)
+    chat_reads.forget("get_messages_page", chat_id)
+
+
+def forget_chat_list_reads(user_id: int):
+    """After adding or renaming one of a user's chats, start fresh listings"""
+    chat_reads.forget("get_chats_by_user_id", user_id)
+    chat_reads.forget("get_chats_page", user_id)
+    chat_reads.forget("get_chat_list_version", user_id)
+
+
+def pack_message(message: ChatMessage) -> bytes:
+    """Encode a message as the value of its packed cell"""
+    flags = PACKED_TRUNCATED if message.truncated else 0
+    if message.model is not None:
+        flags |= PACKED_HAS_MODEL
+    tokens = [getattr(message, field) for field in MESSAGE_TOKEN_FIELDS]
+
+    message_type = message.message_type.encode("utf-8")
+    model = (message.model or "").encode("utf-8")
+    content = message.content.encode("utf-8")
+    if len(content) >= COMPRESS_CONTENT_MIN_BYTES:
+        compressed = zstandard.compress(content, COMPRESS_CONTENT_LEVEL)
+        if len(compressed) < len(content):
+            content = compressed
+            flags |= PACKED_ZSTD_CONTENT
+    header = PACKED_MESSAGE_HEADER.pack(
+        PACKED_MESSAGE_VERSION, flags, message.user_id, (message.created_at - EPOCH) // MICROSECOND,
+        *(-1 if count is None else count for count in tokens), len(message_type), len(model), len(content),
+    )
+    return b"".join((header, message_type, model, content))
+
+
+def unpack_message(row_key: str, value: bytes) -> ChatMessage:
+    """Decode a packed message cell, decompressing its content if flagged.
+
+    Every field comes out already typed. Passing typed values to the validating constructor is cheaper than
+    model_construct, which copies field by field in Python.
+    """
+    if value[0] != PACKED_MESSAGE_VERSION:
+        raise ValueError(f"Unknown packed message version {value[0]} in {row_key}")
+    _, flags, user_id, micros, *tokens, type_length, model_length, content_length = \
+        PACKED_MESSAGE_HEADER.unpack_from(value)
+
+    start = PACKED_MESSAGE_HEADER.size
+    model_start = start + type_length
+    content_start = model_start + model_length
+    content = value[content_start:content_start + content_length]
+    if flags & PACKED_ZSTD_CONTENT:
+        content = zstandard.decompress(content)
+    prefix, message_id = row_key.rsplit(MESSAGE_KEY_SEPARATOR, 1)
+
+    fields = dict(zip(MESSAGE_TOKEN_FIELDS, [None if count < 0 else count for count in tokens]))
+    return ChatMessage(
+        id=int(message_id),
+        chat_id=prefix[len(chat_row_key("")):],
+        user_id=user_id,
+        message_type=value[start:model_start].decode("utf-8"),
+        content=content.decode("utf-8"),
+        model=value[model_start:content_start].decode("utf-8") if flags & PACKED_HAS_MODEL else None,
+        truncated=bool(flags & PACKED_TRUNCATED),
+        created_at=EPOCH + micros * MICROSECOND,
+        **fields,
+    )
+
+
+@instrumented("chat")
+class AsyncBigtableChatService:
+    """Service class for chat operations with Bigtable, on the async data client"""
+
+    def _row_to_chat(self, row_key: str, chat_data: Dict[str, Any], chat_id: Optional[str] = None) -> Chat:
+        """Convert Bigtable chat or index row values to Chat object"""
         # Parse datetime fields
         if "created_at" in chat_data:
             chat_data["created_at"] = datetime.fromisoformat(chat_data["created_at"])
         if "updated_at" in chat_data and chat_data["updated_at"]:
             chat_data["updated_at"] = datetime.fromisoformat(chat_data["updated_at"])
-        
-        # Convert row key to chat ID
-        chat_data["id"] = row_key.replace("chat#", "")
-        
+
+        # Convert row key to chat ID (index rows pass it explicitly)
+        chat_data["id"] = chat_id if chat_id is not None else row_key.replace("chat#", "")
+
         return Chat(**chat_data)
-    
-    def _row_to_message(self, row_key: str, row_data: Dict[str, Any]) -> ChatMessage:
-        """Convert Bigtable row data to ChatMessage object"""
-        message_data = {}
-        
-        # Parse row data
-        for full_column_name, cell_list in row_data.items():
-            if isinstance(full_column_name, bytes):
-                full_column_name = full_column_name.decode('utf-8')
-            
-            if cell_list and isinstance(cell_list, list) and cell_list:
-                cell = cell_list[0]
-                value = cell.value
-                if isinstance(value, bytes):
-                    value = value.decode('utf-8')
-                
-                clean_column = full_column_name.split(':')[-1]
-                message_data[clean_column] = value
-        
+
+    def _read_message(self, row: Row) -> ChatMessage:
+        """Decode a message row in either the packed or the one-cell-per-field layout"""
+        row_key = row.row_key.decode('utf-8')
+        for cell in row.cells:
+            if cell.qualifier == PACKED_MESSAGE_COLUMN.encode():
+                return unpack_message(row_key, cell.value)
+        return self._row_to_message(row_key, row_values(row))
+
+    def _row_to_message(self, row_key: str, message_data: Dict[str, Any]) -> ChatMessage:
+        """Convert one-cell-per-field Bigtable row values to ChatMessage object"""
         # Parse datetime fields
         if "created_at" in message_data:
             message_data["created_at"] = datetime.fromisoformat(message_data["created_at"])
-        
+
         # Parse integer fields
-        if "tokens_used" in message_data and message_data["tokens_used"]:
-            message_data["tokens_used"] = int(message_data["tokens_used"])
-        
-        # Convert row key to message ID
-        message_data["id"] = int(row_key.replace("message#", ""))
-        
+        for field in MESSAGE_TOKEN_FIELDS:
+            if message_data.get(field):
+                message_data[field] = int(message_data[field])
+
+        # Parse boolean fields
+        message_data["truncated"] = message_data.get("truncated") == "1"
+
+        # Convert row key to message ID (chat-scoped or legacy layout)
+        if MESSAGE_KEY_SEPARATOR in row_key:
+            message_data["id"] = int(row_key.rsplit(MESSAGE_KEY_SEPARATOR, 1)[1])
+        else:
+            message_data["id"] = int(row_key.replace(LEGACY_MESSAGE_PREFIX, ""))
+
         return ChatMessage(**message_data)
-    
-    def create_chat(self, title: str, user_id: int, chat_id: str = None) -> Chat:
-        """Create a new chat with optional client-provided ID"""
+
+    async def create_chat(self, title: str, user_id: int, chat_id: str = None) -> Chat:
+        """Create a new chat with optional client-provided ID.
+
+        If a chat with that ID already exists (a concurrent first message
+        created it), that chat is returned instead and nothing is written.
+        """
         if chat_id is None:
-            import time
-            chat_id = str(int(time.time() * 1000000))  # microsecond timestamp as string
-        
-        row_key = f"chat#{chat_id}"
-        row = self.table.direct_row(row_key)
-        
-        now = datetime.utcnow().isoformat()
-        
-        # Set chat data
-        row.set_cell(CHAT_DATA_FAMILY, "title", title)
-        row.set_cell(CHAT_DATA_FAMILY, "user_id", str(user_id))
-        
-        # Set metadata
-        row.set_cell(METADATA_FAMILY, "created_at", now)
-        row.set_cell(METADATA_FAMILY, "updated_at", now)
-        
-        # Write to Bigtable
-        row.commit()
-        
+            chat_id = str(uuid.uuid4())  # like the client's ids, so chat keys never cluster
+
+        created_at = datetime.utcnow()
+        now = created_at.isoformat()
+
+        chat_mutations = [
+            # Set chat data
+            SetCell(CHAT_DATA_FAMILY, "title", title),
+            SetCell(CHAT_DATA_FAMILY, "user_id", str(user_id)),
+            # Set metadata
+            SetCell(METADATA_FAMILY, "created_at", now),
+            SetCell(METADATA_FAMILY, "updated_at", now),
+        ]
+
+        # Insert-if-absent: with no predicate the check is "row has any cells",
+        # so of two concurrent creates only one writes the chat and its index row
+        exists = await get_async_table().check_and_mutate_row(
+            chat_row_key(chat_id), None, false_case_mutations=chat_mutations
+        )
+        forget_chat_reads(chat_id)
+        if exists:
+            return await self.get_chat_by_id(chat_id)
+
+        await commit_rows([self._user_chat_index_row(user_id, created_at, chat_id, title)])
+        # After the write, so a version is never paired with an older list
+        await self._bump_chat_list_version(user_id)
+
+        # A new chat's history is known to be empty, so its turns never read it
+        history_cache.put(chat_id, [], created_at)
+
         return Chat(
             id=chat_id,
             title=title,
@@ -101,115 +254,313 @@ class BigtableChatService:
             created_at=datetime.fromisoformat(now),
             updated_at=datetime.fromisoformat(now)
         )
-    
-    def get_chat_by_id(self, chat_id: str) -> Optional[Chat]:
+
+    @coalesced(chat_reads)
+    async def get_chat_by_id(self, chat_id: str) -> Optional[Chat]:
         """Get chat by ID"""
-        row_key = f"chat#{chat_id}"
-        row = self.table.read_row(row_key)
-        
+        row_key = chat_row_key(chat_id)
+        row = await get_async_table().read_row(row_key)
+
         if row:
-            return self._row_to_chat(row_key, row.to_dict())
+            return self._row_to_chat(row_key, row_values(row))
         return None
-    
-    def get_chats_by_user_id(self, user_id: int) -> List[Chat]:
-        """Get all chats for a user"""
-        # This is a scan operation - in production you might want secondary indexes
-        row_filter = FamilyNameRegexFilter(f"{CHAT_DATA_FAMILY}")
-        rows = self.table.read_rows(filter_=row_filter)
-        
+
+    @coalesced(chat_reads)
+    async def get_chats_by_user_id(self, user_id: int, limit: Optional[int] = None) -> List[Chat]:
+        """Get a user's chats, newest first, from the per-user index"""
+        if not await is_migration_complete(USER_CHAT_INDEX_MIGRATION):
+            return (await self._scan_chats_by_user_id(user_id))[:limit]
+
+        query = ReadRowsQuery(row_ranges=prefix_range(user_chat_index_prefix(user_id)), limit=limit)
+        rows = await get_async_table().read_rows(query)
+        return [self._index_row_to_chat(row) for row in rows]
+
+    @coalesced(chat_reads)
+    async def get_chats_page(self, user_id: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[Chat], Optional[str]]:
+        """Get one page of a user's chats, newest first, and the cursor for the next page.
+
+        Raises ValueError for a cursor that wasn't issued for this user.
+        """
+        if not await is_migration_complete(USER_CHAT_INDEX_MIGRATION):
+            # The fallback scan has no stable keys to page on; return everything
+            return await self._scan_chats_by_user_id(user_id), None
+
+        rows, next_cursor = await read_page(user_chat_index_prefix(user_id), limit, cursor)
+        return [self._index_row_to_chat(row) for row in rows], next_cursor
+
+    def _index_row_to_chat(self, row) -> Chat:
+        row_key = row.row_key.decode('utf-8')
+        chat_id = row_key.rsplit('#', 1)[1]
+        return self._row_to_chat(row_key, row_values(row), chat_id=chat_id)
+
+    async def _scan_chats_by_user_id(self, user_id: int) -> List[Chat]:
+        """Full table scan for a user's chats, used until the index is backfilled"""
+        query = ReadRowsQuery(
+            row_ranges=prefix_range("chat#"),
+            row_filter=FamilyNameRegexFilter(f"{CHAT_DATA_FAMILY}|{METADATA_FAMILY}"),
+        )
+
         chats = []
-        for row_key, row_data in rows.rows.items():
-            if row_key.decode('utf-8').startswith('chat#'):
-                user_data = row_data.to_dict()
-                # Check if this chat belongs to the user
-                user_id_cells = user_data.get(b'chat_data:user_id', [])
-                if user_id_cells and int(user_id_cells[0].value.decode('utf-8')) == user_id:
-                    chats.append(self._row_to_chat(row_key.decode('utf-8'), user_data))
-        
+        async for row in await get_async_table().read_rows_stream(query):
+            row_key = row.row_key.decode('utf-8')
+            chat_data = row_values(row)
+            # Check if this chat belongs to the user (message rows have no user_id)
+            if chat_data.get("user_id") and int(chat_data["user_id"]) == user_id:
+                chats.append(self._row_to_chat(row_key, chat_data))
+
         # Sort by created_at descending
         chats.sort(key=lambda x: x.created_at, reverse=True)
         return chats
-    
-    def update_chat(self, chat_id: str, title: Optional[str] = None) -> Optional[Chat]:
+
+    def _user_chat_index_row(self, user_id: int, created_at: datetime, chat_id: str, title: str) -> RowMutationEntry:
+        return RowMutationEntry(user_chat_index_key(user_id, created_at, chat_id), [
+            SetCell(CHAT_DATA_FAMILY, "title", title),
+            SetCell(CHAT_DATA_FAMILY, "user_id", str(user_id)),
+            SetCell(METADATA_FAMILY, "created_at", created_at.isoformat()),
+        ])
+
+    async def backfill_user_chat_index(self, batch_size: int = 500) -> int:
+        """Write index rows for chats created before the per-user index existed.
+
+        Index rows are keyed deterministically from the chat row, so this is
+        safe to re-run and to run while serving. Returns the number of chats indexed.
+        """
+        query = ReadRowsQuery(
+            row_ranges=prefix_range("chat#"),
+            row_filter=FamilyNameRegexFilter(f"{CHAT_DATA_FAMILY}|{METADATA_FAMILY}"),
+        )
+
+        indexed = 0
+        batch = []
+        async for row in await get_async_table().read_rows_stream(query):
+            row_key = row.row_key.decode('utf-8')
+            if MESSAGE_KEY_SEPARATOR in row_key:
+                continue
+            chat = self._row_to_chat(row_key, row_values(row))
+            batch.append(self._user_chat_index_row(chat.user_id, chat.created_at, chat.id, chat.title))
+
+            if len(batch) >= batch_size:
+                await commit_rows(batch)
+                indexed += len(batch)
+                batch = []
+
+        await commit_rows(batch)
+        indexed += len(batch)
+
+        await mark_migration_complete(USER_CHAT_INDEX_MIGRATION)
+        return indexed
+
+    async def update_chat(self, chat_id: str, title: Optional[str] = None) -> Optional[Chat]:
         """Update chat information"""
-        row_key = f"chat#{chat_id}"
-        row = self.table.direct_row(row_key)
-        
-        # Check if chat exists
-        existing_row = self.table.read_row(row_key)
-        if not existing_row:
+        row_key = chat_row_key(chat_id)
+
+        # Check if chat exists (shared with any concurrent read of the same chat)
+        existing_chat = await self.get_chat_by_id(chat_id)
+        if not existing_chat:
             return None
-        
-        now = datetime.utcnow().isoformat()
-        
-        # Update provided fields
-        if title is not None:
-            row.set_cell(CHAT_DATA_FAMILY, "title", title)
-        
+
+        updated_at = datetime.utcnow()
+
         # Update timestamp
-        row.set_cell(METADATA_FAMILY, "updated_at", now)
-        
-        # Write to Bigtable
-        row.commit()
-        
-        return self.get_chat_by_id(chat_id)
-    
-    def create_message(self, chat_id: str, user_id: int, message_type: str, content: str, 
-                      tokens_used: Optional[int] = None, model: Optional[str] = None) -> ChatMessage:
-        """Create a new chat message"""
-        import time
-        message_id = int(time.time() * 1000000)  # microsecond timestamp
-        
-        row_key = f"message#{message_id}"
-        row = self.table.direct_row(row_key)
-        
-        now = datetime.utcnow().isoformat()
-        
-        # Set message data
-        row.set_cell(MESSAGE_DATA_FAMILY, "chat_id", chat_id)
-        row.set_cell(MESSAGE_DATA_FAMILY, "user_id", str(user_id))
-        row.set_cell(MESSAGE_DATA_FAMILY, "message_type", message_type)
-        row.set_cell(MESSAGE_DATA_FAMILY, "content", content)
-        
-        if tokens_used is not None:
-            row.set_cell(MESSAGE_DATA_FAMILY, "tokens_used", str(tokens_used))
-        if model is not None:
-            row.set_cell(MESSAGE_DATA_FAMILY, "model", model)
-        
-        # Set metadata
-        row.set_cell(METADATA_FAMILY, "created_at", now)
-        
+        mutations = [SetCell(METADATA_FAMILY, "updated_at", updated_at.isoformat())]
+        rows = []
+        changes = {"updated_at": updated_at}
+
+        # Update provided fields, keeping the index row's copy of the title in step
+        if title is not None:
+            mutations.append(SetCell(CHAT_DATA_FAMILY, "title", title))
+            rows.append(self._user_chat_index_row(
+                existing_chat.user_id, existing_chat.created_at, chat_id, title
+            ))
+            changes["title"] = title
+
         # Write to Bigtable
-        row.commit()
-        
-        # Update chat's updated_at timestamp
-        self.update_chat(chat_id)
-        
-        return ChatMessage(
-            id=message_id,
+        await commit_rows([RowMutationEntry(row_key, mutations)] + rows)
+        forget_chat_reads(chat_id)
+        if title is not None:
+            await self._bump_chat_list_version(existing_chat.user_id)
+
+        # The row is now exactly what was read plus these changes, so no second read
+        return existing_chat.model_copy(update=changes)
+
+    async def _bump_chat_list_version(self, user_id: int):
+        await get_async_table().read_modify_write_row(
+            chat_list_version_key(user_id), IncrementRule(USAGE_FAMILY, CHAT_LIST_VERSION_COLUMN, 1)
+        )
+        forget_chat_list_reads(user_id)
+
+    @coalesced(chat_reads)
+    async def get_chat_list_version(self, user_id: int) -> Optional[int]:
+        """Version of the user's chat list, or None if it has never changed since versions were kept"""
+        row = await get_async_table().read_row(chat_list_version_key(user_id))
+        if not row:
+            return None
+        return row_counters(row).get(CHAT_LIST_VERSION_COLUMN)
+
+    def _message_row(self, message: ChatMessage) -> RowMutationEntry:
+        """Mutations that write one message row"""
+        return RowMutationEntry(
+            message_row_key(message.chat_id, message.id),
+            SetCell(MESSAGE_DATA_FAMILY, PACKED_MESSAGE_COLUMN, pack_message(message)),
+        )
+
+    async def create_message(self, chat_id: str, user_id: int, message_type: str, content: str,
+                      tokens_used: Optional[int] = None, model: Optional[str] = None,
+                      truncated: bool = False, usage: Optional[TokenUsage] = None,
+                      previous_updated_at: Optional[datetime] = None) -> ChatMessage:
+        """Create a new chat message; truncated marks a reply cut short before it finished.
+
+        usage, for assistant replies, fills in the token breakdown and tokens_used.
+        previous_updated_at is the chat's updated_at as the caller last saw it
+        (from the chat, or the previous message it wrote); the cached history
+        is only extended if it was cached as of that same write.
+        """
+        token_fields = {"tokens_used": tokens_used}
+        if usage is not None:
+            token_fields = {
+                "tokens_used": usage.total_tokens,
+                "input_tokens": usage.input_tokens,
+                "output_tokens": usage.output_tokens,
+                "cache_read_input_tokens": usage.cache_read_input_tokens,
+                "cache_creation_input_tokens": usage.cache_creation_input_tokens,
+            }
+        messages = await self.create_messages([ChatMessageCreate(
             chat_id=chat_id,
             user_id=user_id,
             message_type=message_type,
             content=content,
-            tokens_used=tokens_used,
             model=model,
-            created_at=datetime.fromisoformat(now)
-        )
-    
-    def get_messages_by_chat_id(self, chat_id: str) -> List[ChatMessage]:
-        """Get all messages for a chat"""
-        row_filter = FamilyNameRegexFilter(f"{MESSAGE_DATA_FAMILY}")
-        rows = self.table.read_rows(filter_=row_filter)
-        
+            truncated=truncated,
+            **token_fields,
+        )], {chat_id: previous_updated_at})
+        return messages[0]
+
+    async def create_messages(self, messages: List[ChatMessageCreate],
+                              previous_updated_at: Optional[Dict[str, Optional[datetime]]] = None) -> List[ChatMessage]:
+        """Create several messages in one MutateRows batch, then bump their chats' updated_at in another.
+
+        MutateRows isn't atomic across rows, so the bump waits for the message
+        rows: a reader that sees the new updated_at (the history cache tag and
+        the chat's ETag) is then sure to see the messages too. Nothing is read
+        first: the chats must already exist, as they always do on the send
+        path, which creates the chat before its first message.
+        previous_updated_at maps chat IDs to the updated_at the caller last
+        saw; cached histories of chats missing from it are dropped.
+        """
+        created_at = datetime.utcnow()
+
+        created = [
+            ChatMessage(id=next_id(), created_at=created_at, **message.model_dump())
+            for message in messages
+        ]
+        chat_ids = list(dict.fromkeys(message.chat_id for message in created))
+
+        await commit_rows([self._message_row(message) for message in created])
+        await commit_rows([
+            RowMutationEntry(chat_row_key(chat_id), SetCell(METADATA_FAMILY, "updated_at", created_at.isoformat()))
+            for chat_id in chat_ids
+        ])
+        for chat_id in chat_ids:
+            forget_chat_reads(chat_id)
+
+        previous_updated_at = dict(previous_updated_at or {})
+        for message in created:
+            history_cache.append(message.chat_id, message, created_at, previous_updated_at.get(message.chat_id))
+            # A second message to the same chat follows this one
+            previous_updated_at[message.chat_id] = created_at
+        return created
+
+    async def get_conversation_history(self, chat: Chat) -> List[ChatMessage]:
+        """Get a chat's messages, from the history cache while it is current"""
+        messages = history_cache.get(chat.id, chat.updated_at)
+        if messages is None:
+            messages = await self.get_messages_by_chat_id(chat.id)
+            history_cache.put(chat.id, messages, chat.updated_at)
+        return messages
+
+    @coalesced(chat_reads)
+    async def get_messages_by_chat_id(self, chat_id: str) -> List[ChatMessage]:
+        """Get all messages for a chat in chronological order"""
+        query = ReadRowsQuery(row_ranges=prefix_range(message_row_prefix(chat_id)))
+        rows = await get_async_table().read_rows(query)
+
+        messages = {}
+        for row in rows:
+            message = self._read_message(row)
+            messages[message.id] = message
+
+        if await is_migration_complete(MESSAGE_MIGRATION):
+            # Keys are ordered by message id, which is a creation timestamp
+            return list(messages.values())
+
+        # Migration still running: also pick up this chat's un-migrated rows
+        for message in await self._get_legacy_messages(chat_id):
+            messages.setdefault(message.id, message)
+        return sorted(messages.values(), key=lambda x: x.id)
+
+    @coalesced(chat_reads)
+    async def get_messages_page(self, chat_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[ChatMessage], Optional[str]]:
+        """Get one page of a chat's messages, oldest first, and the cursor for the next page.
+
+        Raises ValueError for a cursor that wasn't issued for this chat.
+        """
+        if not await is_migration_complete(MESSAGE_MIGRATION):
+            # Legacy rows aren't in the chat's key range yet; return everything
+            return await self.get_messages_by_chat_id(chat_id), None
+
+        rows, next_cursor = await read_page(message_row_prefix(chat_id), limit, cursor)
+        messages = [self._read_message(row) for row in rows]
+        return messages, next_cursor
+
+    async def _get_legacy_messages(self, chat_id: str) -> List[ChatMessage]:
+        """Full scan of the pre-migration message#{id} rows for one chat"""
+        query = ReadRowsQuery(row_ranges=prefix_range(LEGACY_MESSAGE_PREFIX))
+
         messages = []
-        for row_key, row_data in rows.rows.items():
-            if row_key.decode('utf-8').startswith('message#'):
-                message_data = row_data.to_dict()
-                # Check if this message belongs to the chat
-                chat_id_cells = message_data.get(b'message_data:chat_id', [])
-                if chat_id_cells and chat_id_cells[0].value.decode('utf-8') == chat_id:
-                    messages.append(self._row_to_message(row_key.decode('utf-8'), message_data))
-        
-        # Sort by created_at ascending (chronological order)
-        messages.sort(key=lambda x: x.created_at)
-        return messages
\ No newline at end of file
+        async for row in await get_async_table().read_rows_stream(query):
+            message_data = row_values(row)
+            if message_data.get("chat_id") == chat_id:
+                messages.append(self._row_to_message(row.row_key.decode('utf-8'), message_data))
+        return messages
+
+    async def migrate_legacy_messages(self, batch_size: int = 500) -> int:
+        """Move message#{id} rows to chat#{chat_id}#msg#{id}, safe to run while serving.
+
+        Readers merge both layouts until the migration marker row is written, and
+        the copy is idempotent (same message id, same target key), so the
+        migration can be interrupted and re-run. Returns the number of rows moved.
+        """
+        query = ReadRowsQuery(row_ranges=prefix_range(LEGACY_MESSAGE_PREFIX))
+
+        moved = 0
+        copies, deletes = [], []
+        async for row in await get_async_table().read_rows_stream(query):
+            legacy_key = row.row_key.decode('utf-8')
+            message_data = row_values(row)
+            if not message_data.get("chat_id"):
+                continue
+
+            # Copied rows are written in the packed layout
+            copies.append(self._message_row(self._row_to_message(legacy_key, message_data)))
+            deletes.append(RowMutationEntry(legacy_key, DeleteAllFromRow()))
+
+            if len(copies) >= batch_size:
+                moved += await self._flush_migration_batch(copies, deletes)
+                copies, deletes = [], []
+
+        moved += await self._flush_migration_batch(copies, deletes)
+
+        await mark_migration_complete(MESSAGE_MIGRATION)
+        return moved
+
+    async def _flush_migration_batch(self, copies: List[RowMutationEntry], deletes: List[RowMutationEntry]) -> int:
+        # Copies must land before the originals are removed so readers never miss a message
+        await commit_rows(copies)
+        await commit_rows(deletes)
+        return len(copies)
+
+
+class BigtableChatService(SyncServiceFacade):
+    """Blocking chat service for scripts; see AsyncBigtableChatService"""
+
+    async_service_class = AsyncBigtableChatService
@@ -0,0 +1,57 @@
+from datetime import date, datetime
+from typing import List, Optional
+from google.cloud.bigtable.data import ReadRowsQuery, RowRange
+from google.cloud.bigtable.data.read_modify_write_rules import IncrementRule
+from bigtable_client import (
+    get_async_table,
+    row_counters,
+    SyncServiceFacade,
+    USAGE_FAMILY,
+)
+from metrics import instrumented
+from .usage import DailyUsageSchema, TokenUsage
+
+# One counter cell per TokenUsage field
+USAGE_COUNTERS = tuple(TokenUsage.model_fields)
+
+
+def usage_row_key(user_id: int, day: date) -> str:
+    return f"usage#{user_id}#{day:%Y%m%d}"
+
+
+@instrumented("usage")
+class AsyncBigtableUsageService:
+    """Per-user daily token counters, kept with atomic increments instead of scans over messages"""
+
+    def _row_to_daily_usage(self, row_key: str, counters: dict) -> DailyUsageSchema:
+        """Convert a counter row to DailyUsageSchema; counters never incremented read as zero"""
+        day = datetime.strptime(row_key.rsplit("#", 1)[1], "%Y%m%d").date()
+        return DailyUsageSchema(day=day, **counters)
+
+    async def record_usage(self, user_id: int, usage: TokenUsage, day: Optional[date] = None):
+        """Add one reply's token counts to the user's counters for the (UTC) day"""
+        day = day or datetime.utcnow().date()
+        rules = [
+            IncrementRule(USAGE_FAMILY, name, getattr(usage, name))
+            for name in USAGE_COUNTERS
+            if getattr(usage, name)
+        ]
+        if rules:
+            # ReadModifyWrite is applied server side, so concurrent replies never lose counts
+            await get_async_table().read_modify_write_row(usage_row_key(user_id, day), rules)
+
+    async def get_daily_usage(self, user_id: int, start: date, end: date) -> List[DailyUsageSchema]:
+        """Get the user's usage for each day from start to end inclusive that has any"""
+        query = ReadRowsQuery(row_ranges=RowRange(
+            start_key=usage_row_key(user_id, start),
+            end_key=usage_row_key(user_id, end),
+            end_is_inclusive=True,
+        ))
+        rows = await get_async_table().read_rows(query)
+        return [self._row_to_daily_usage(row.row_key.decode("utf-8"), row_counters(row)) for row in rows]
+
+
+class BigtableUsageService(SyncServiceFacade):
+    """Blocking usage service for scripts; see AsyncBigtableUsageService"""
+
+    async_service_class = AsyncBigtableUsageService
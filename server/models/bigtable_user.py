@@ -1,120 +1,204 @@
 import json
 from datetime import datetime
-from typing import Optional, Dict, Any
-from google.cloud.bigtable.row import DirectRow
-from google.cloud.bigtable.row_filters import FamilyNameRegexFilter
-from bigtable_client import get_users_table, USER_DATA_FAMILY, METADATA_FAMILY
+from typing import Optional, Dict, Any, List
+from google.cloud.bigtable.data import DeleteAllFromRow, ReadRowsQuery, RowMutationEntry, SetCell
+from google.cloud.bigtable.data.row_filters import FamilyNameRegexFilter
+from bigtable_client import (
+    commit_rows,
+    get_async_table,
+    is_migration_complete,
+    key_salt,
+    mark_migration_complete,
+    prefix_range,
+    row_values,
+    SyncServiceFacade,
+    USER_DATA_FAMILY,
+    METADATA_FAMILY,
+)
+from metrics import instrumented
+from cache import principal_cache
+from ids import next_id
+from singleflight import coalesced, user_reads
 from .user import User
 
+# Unique lookup rows pointing at user#{id}, claimed with check-and-mutate
+USER_LOOKUP_MIGRATION = "user_lookups"
+LOOKUP_USER_ID_COLUMN = "user_id"
+# Fresh IDs tried when a new user's row already exists, which only happens
+# when two instances share a worker number (see ids.py)
+CREATE_USER_ATTEMPTS = 5
 
-class BigtableUserService:
-    """Service class for user operations with Bigtable"""
+# User ids are time-ordered, so user rows are salted: user#{salt}#{id}.
+# Rows written before that are at user#{id}; see migrate_user_keys()
+USER_KEY_MIGRATION = "user_keys"
 
-    def __init__(self):
-        self.table = get_users_table()
 
-    def _row_to_user(self, row_key: str, row_data: Dict[str, Any]) -> User:
-        """Convert Bigtable row data to User object"""
-        user_data = {}
-        
-        # The row_data has full column names as keys (e.g., b'user_data:name')
-        # Each value is a list of Cell objects
-        for full_column_name, cell_list in row_data.items():
-            if isinstance(full_column_name, bytes):
-                full_column_name = full_column_name.decode('utf-8')
-            
-            if cell_list and isinstance(cell_list, list) and cell_list:
-                # Get the most recent cell value
-                cell = cell_list[0]
-                value = cell.value
-                if isinstance(value, bytes):
-                    value = value.decode('utf-8')
-                
-                # Extract just the column name (remove family prefix)
-                # e.g., 'user_data:name' -> 'name'
-                clean_column = full_column_name.split(':')[-1]
-                user_data[clean_column] = value
-        
+def user_row_key(user_id: int) -> str:
+    return f"user#{key_salt(user_id)}#{user_id}"
+
+
+def legacy_user_row_key(user_id: int) -> str:
+    return f"user#{user_id}"
+
+
+def google_id_lookup_key(google_id: str) -> str:
+    return f"gid#{google_id}"
+
+
+def email_lookup_key(email: str) -> str:
+    return f"email#{email.lower()}"
+
+
+@instrumented("user")
+class AsyncBigtableUserService:
+    """Service class for user operations with Bigtable, on the async data client"""
+
+    def _row_to_user(self, row_key: str, user_data: Dict[str, Any]) -> User:
+        """Convert Bigtable row values (column name -> value) to User object"""
         # Parse datetime fields if they exist
         if "created_at" in user_data:
             user_data["created_at"] = datetime.fromisoformat(user_data["created_at"])
         if "updated_at" in user_data and user_data["updated_at"]:
             user_data["updated_at"] = datetime.fromisoformat(user_data["updated_at"])
         
-        # Convert row key to user ID
-        user_data["id"] = int(row_key.replace("user#", ""))
+        # Convert row key to user ID (salted or legacy layout)
+        user_data["id"] = int(row_key.rsplit("#", 1)[1])
         
         return User(**user_data)
 
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
+    @coalesced(user_reads)
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
         """Get user by ID"""
-        row_key = f"user#{user_id}"
-        row = self.table.read_row(row_key)
+        row_key = user_row_key(user_id)
+        row = await get_async_table().read_row(row_key)
+
+        if not row and not await is_migration_complete(USER_KEY_MIGRATION):
+            row_key = legacy_user_row_key(user_id)
+            row = await get_async_table().read_row(row_key)
 
         if row:
-            return self._row_to_user(row_key, row.to_dict())
+            return self._row_to_user(row_key, row_values(row))
         return None
 
-    def get_user_by_google_id(self, google_id: str) -> Optional[User]:
-        """Get user by Google ID"""
-        # Use a filter to find user by google_id
-        row_filter = FamilyNameRegexFilter(f"{USER_DATA_FAMILY}")
-        rows = self.table.read_rows(filter_=row_filter)
-
-        for row_key, row_data in rows.rows.items():
-            user_data = row_data.to_dict()
-            # Check if this row has the matching google_id
-            google_id_cells = user_data.get(b'user_data:google_id', [])
-            if (
-                google_id_cells
-                and google_id_cells[0].value.decode("utf-8") == google_id
-            ):
-                return self._row_to_user(row_key, user_data)
-
+    async def _existing_user_row_key(self, user_id: int) -> Optional[str]:
+        """Key of the user's row in whichever layout it is stored, or None"""
+        row_key = user_row_key(user_id)
+        if await get_async_table().row_exists(row_key):
+            return row_key
+        if not await is_migration_complete(USER_KEY_MIGRATION):
+            row_key = legacy_user_row_key(user_id)
+            if await get_async_table().row_exists(row_key):
+                return row_key
         return None
 
-    def get_user_by_email(self, email: str) -> Optional[User]:
+    @coalesced(user_reads)
+    async def get_user_by_google_id(self, google_id: str) -> Optional[User]:
+        """Get user by Google ID"""
+        user = await self._get_user_by_lookup(google_id_lookup_key(google_id))
+        if user is None and not await is_migration_complete(USER_LOOKUP_MIGRATION):
+            user = await self._scan_user_by_column("google_id", google_id)
+        return user
+
+    @coalesced(user_reads)
+    async def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
-        # Use a filter to find user by email
-        row_filter = FamilyNameRegexFilter(f"{USER_DATA_FAMILY}")
-        rows = self.table.read_rows(filter_=row_filter)
+        user = await self._get_user_by_lookup(email_lookup_key(email))
+        if user is None and not await is_migration_complete(USER_LOOKUP_MIGRATION):
+            user = await self._scan_user_by_column("email", email)
+        return user
 
-        for row_key, row_data in rows.rows.items():
-            user_data = row_data.to_dict()
-            # Check if this row has the matching email
-            email_cells = user_data.get(b'user_data:email', [])
-            if email_cells and email_cells[0].value.decode("utf-8") == email:
-                return self._row_to_user(row_key, user_data)
+    async def _read_lookup(self, lookup_key: str) -> Optional[int]:
+        row = await get_async_table().read_row(lookup_key)
+        if not row:
+            return None
+        return int(row_values(row)[LOOKUP_USER_ID_COLUMN])
 
-        return None
+    async def _get_user_by_lookup(self, lookup_key: str) -> Optional[User]:
+        """Resolve a gid#/email# lookup row to its user"""
+        user_id = await self._read_lookup(lookup_key)
+        if user_id is None:
+            return None
+        return await self.get_user_by_id(user_id)
 
-    def create_user(
-        self, name: str, email: str, google_id: str, picture: Optional[str] = None
-    ) -> User:
-        """Create a new user"""
-        # Generate user ID (in production, use a proper ID generation strategy)
-        import time
+    async def _scan_user_by_column(self, column: str, value: str) -> Optional[User]:
+        """Full scan of user rows, used until the lookup rows are backfilled"""
+        query = ReadRowsQuery(
+            row_ranges=prefix_range("user#"),
+            row_filter=FamilyNameRegexFilter(f"{USER_DATA_FAMILY}|{METADATA_FAMILY}"),
+        )
+
+        async for row in await get_async_table().read_rows_stream(query):
+            user_data = row_values(row)
+            # Check if this row has the matching value
+            if user_data.get(column) == value:
+                return self._row_to_user(row.row_key.decode("utf-8"), user_data)
+
+        return None
 
-        user_id = int(time.time() * 1000000)  # microsecond timestamp
+    async def _claim_lookup(self, lookup_key: str, user_id: int) -> Optional[int]:
+        """Point lookup_key at user_id unless it is already taken.
 
-        row_key = f"user#{user_id}"
-        row = self.table.direct_row(row_key)
+        Returns None if the claim succeeded, otherwise the id of the user
+        that already owns the lookup row. The check and the write are a single
+        atomic check-and-mutate, so only one of several concurrent claims wins.
+        """
+        # With no predicate the check is "row has any cells"; the false-case
+        # mutation is applied only when the lookup row does not exist yet
+        taken = await get_async_table().check_and_mutate_row(
+            lookup_key,
+            None,
+            false_case_mutations=SetCell(USER_DATA_FAMILY, LOOKUP_USER_ID_COLUMN, str(user_id)),
+        )
+        if not taken:
+            return None
+        return await self._read_lookup(lookup_key)
 
+    async def create_user(
+        self, name: str, email: str, google_id: str, picture: Optional[str] = None
+    ) -> User:
+        """Create a new user, or return the existing one if a concurrent login won"""
         now = datetime.utcnow().isoformat()
 
         # Set user data - ensure all values are strings and not None
-        row.set_cell(USER_DATA_FAMILY, "name", str(name) if name is not None else "")
-        row.set_cell(USER_DATA_FAMILY, "email", str(email) if email is not None else "")
-        row.set_cell(USER_DATA_FAMILY, "google_id", str(google_id) if google_id is not None else "")
+        mutations = [
+            SetCell(USER_DATA_FAMILY, "name", str(name) if name is not None else ""),
+            SetCell(USER_DATA_FAMILY, "email", str(email) if email is not None else ""),
+            SetCell(USER_DATA_FAMILY, "google_id", str(google_id) if google_id is not None else ""),
+        ]
         if picture is not None:
-            row.set_cell(USER_DATA_FAMILY, "picture", str(picture))
+            mutations.append(SetCell(USER_DATA_FAMILY, "picture", str(picture)))
 
         # Set metadata
-        row.set_cell(METADATA_FAMILY, "created_at", now)
-        row.set_cell(METADATA_FAMILY, "updated_at", now)
+        mutations.append(SetCell(METADATA_FAMILY, "created_at", now))
+        mutations.append(SetCell(METADATA_FAMILY, "updated_at", now))
 
-        # Write to Bigtable
-        row.commit()
+        # Insert-if-absent: with no predicate the check is "row has any cells",
+        # so an ID another instance already used is never written over
+        for _ in range(CREATE_USER_ATTEMPTS):
+            user_id = next_id()
+            row_key = user_row_key(user_id)
+            exists = await get_async_table().check_and_mutate_row(
+                row_key, None, false_case_mutations=mutations
+            )
+            if not exists:
+                break
+        else:
+            raise RuntimeError(f"No unused user ID after {CREATE_USER_ATTEMPTS} attempts; check WORKER_ID")
+
+        # The user row only becomes reachable once its google_id is claimed. If
+        # another login claimed it first, drop our row and use theirs.
+        winner_id = await self._claim_lookup(google_id_lookup_key(google_id), user_id)
+        if winner_id is not None:
+            await get_async_table().mutate_row(row_key, DeleteAllFromRow())
+            return await self.get_user_by_id(winner_id)
+
+        if await self._claim_lookup(email_lookup_key(email), user_id) is not None:
+            print(f"Email for user {user_id} is already claimed by another user")
+
+        principal_cache.invalidate_user(user_id)
+        # Lookups that missed before the claims must not answer later logins
+        user_reads.forget("get_user_by_google_id", google_id)
+        user_reads.forget("get_user_by_email", email)
 
         return User(
             id=user_id,
@@ -126,31 +210,109 @@ class BigtableUserService:
             updated_at=datetime.fromisoformat(now),
         )
 
-    def update_user(
+    async def update_user(
         self, user_id: int, name: Optional[str] = None, picture: Optional[str] = None
     ) -> Optional[User]:
         """Update user information"""
-        row_key = f"user#{user_id}"
-        row = self.table.direct_row(row_key)
-
         # Check if user exists
-        existing_row = self.table.read_row(row_key)
-        if not existing_row:
+        row_key = await self._existing_user_row_key(user_id)
+        if row_key is None:
             return None
 
         now = datetime.utcnow().isoformat()
 
         # Update provided fields - ensure values are strings
+        mutations = []
         if name is not None:
-            row.set_cell(USER_DATA_FAMILY, "name", str(name))
+            mutations.append(SetCell(USER_DATA_FAMILY, "name", str(name)))
         if picture is not None:
-            row.set_cell(USER_DATA_FAMILY, "picture", str(picture))
+            mutations.append(SetCell(USER_DATA_FAMILY, "picture", str(picture)))
 
         # Update timestamp
-        row.set_cell(METADATA_FAMILY, "updated_at", now)
+        mutations.append(SetCell(METADATA_FAMILY, "updated_at", now))
 
         # Write to Bigtable
-        row.commit()
+        await get_async_table().mutate_row(row_key, mutations)
+        principal_cache.invalidate_user(user_id)
+        # Lookups by google_id or email resolve to this user too, and their keys aren't known here
+        user_reads.forget("get_user_by_id", user_id)
+        user_reads.forget("get_user_by_google_id")
+        user_reads.forget("get_user_by_email")
 
         # Return updated user
-        return self.get_user_by_id(user_id)
\ No newline at end of file
+        return await self.get_user_by_id(user_id)
+
+    async def backfill_user_lookups(self) -> int:
+        """Claim gid#/email# lookup rows for users created before they existed.
+
+        Claims never overwrite, so this is safe to re-run and to run while
+        serving. Unsalted users are visited in id (creation) order, so if
+        earlier races produced duplicate users the oldest one keeps the lookup
+        rows; run this before migrate_user_keys() to keep that guarantee.
+        Returns the number of users visited.
+        """
+        query = ReadRowsQuery(
+            row_ranges=prefix_range("user#"),
+            row_filter=FamilyNameRegexFilter(f"{USER_DATA_FAMILY}"),
+        )
+
+        visited = 0
+        async for row in await get_async_table().read_rows_stream(query):
+            user_data = row_values(row)
+            user_id = int(row.row_key.decode("utf-8").rsplit("#", 1)[1])
+            if user_data.get("google_id"):
+                await self._claim_lookup(google_id_lookup_key(user_data["google_id"]), user_id)
+            if user_data.get("email"):
+                await self._claim_lookup(email_lookup_key(user_data["email"]), user_id)
+            visited += 1
+
+        await mark_migration_complete(USER_LOOKUP_MIGRATION)
+        return visited
+
+    async def migrate_user_keys(self, batch_size: int = 500) -> int:
+        """Move user#{id} rows to salted user#{salt}#{id} keys, safe to run while serving.
+
+        Readers fall back to the old key until the migration marker row is
+        written, and copies are idempotent, so this can be interrupted and
+        re-run. Returns the number of rows moved.
+        """
+        query = ReadRowsQuery(row_ranges=prefix_range("user#"))
+
+        moved = 0
+        copies, deletes = [], []
+        async for row in await get_async_table().read_rows_stream(query):
+            legacy_key = row.row_key.decode("utf-8")
+            if legacy_key.count("#") != 1:
+                continue  # already salted
+            user_id = int(legacy_key.rsplit("#", 1)[1])
+
+            # Cells for a column arrive newest first; copy only the latest
+            latest = {}
+            for cell in row.cells:
+                latest.setdefault((cell.family, cell.qualifier), cell.value)
+            copies.append(RowMutationEntry(
+                user_row_key(user_id),
+                [SetCell(family, qualifier, value) for (family, qualifier), value in latest.items()],
+            ))
+            deletes.append(RowMutationEntry(legacy_key, DeleteAllFromRow()))
+
+            if len(copies) >= batch_size:
+                moved += await self._flush_migration_batch(copies, deletes)
+                copies, deletes = [], []
+
+        moved += await self._flush_migration_batch(copies, deletes)
+
+        await mark_migration_complete(USER_KEY_MIGRATION)
+        return moved
+
+    async def _flush_migration_batch(self, copies: List[RowMutationEntry], deletes: List[RowMutationEntry]) -> int:
+        # Copies must land before the originals are removed so readers never miss a user
+        await commit_rows(copies)
+        await commit_rows(deletes)
+        return len(copies)
+
+
+class BigtableUserService(SyncServiceFacade):
+    """Blocking user service for scripts; see AsyncBigtableUserService"""
+
+    async_service_class = AsyncBigtableUserService
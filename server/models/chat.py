@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class Chat(BaseModel):
@@ -35,7 +35,13 @@ class ChatMessage(BaseModel):
     message_type: str  # 'user' or 'assistant'
     content: str  # Either prompt or response content
     tokens_used: Optional[int] = None
+    # Breakdown of tokens_used for assistant replies
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
     model: Optional[str] = None
+    truncated: bool = False
     created_at: datetime
     
     class Config:
@@ -48,7 +54,13 @@ class ChatMessageSchema(BaseModel):
     message_type: str
     content: str
     tokens_used: Optional[int] = None
+    # Breakdown of tokens_used for assistant replies
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
     model: Optional[str] = None
+    truncated: bool = False
     created_at: datetime
     
     class Config:
@@ -60,4 +72,25 @@ class ChatMessageCreate(BaseModel):
     message_type: str
     content: str
     tokens_used: Optional[int] = None
-    model: Optional[str] = None
\ No newline at end of file
+    # Breakdown of tokens_used for assistant replies
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
+    model: Optional[str] = None
+    truncated: bool = False
+
+class ChatSummarySchema(BaseModel):
+    id: str
+    title: str
+
+class ChatListSchema(BaseModel):
+    """One page of a user's chats, newest first"""
+    chats: List[ChatSummarySchema]
+    next_cursor: Optional[str] = None
+
+class ChatDetailSchema(BaseModel):
+    """A chat with one page of its messages, oldest first"""
+    chat: ChatSchema
+    messages: List[ChatMessageSchema]
+    next_cursor: Optional[str] = None
\ No newline at end of file
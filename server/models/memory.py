@@ -0,0 +1,292 @@
+"""In-memory storage backend (STORAGE_BACKEND=memory).
+
+Keeps the same keys, orderings and cursors as the Bigtable services, over
+process-local dicts and sorted key lists instead of RPCs, so the API can be
+load-tested and profiled offline. Nothing is persisted, and each worker
+process has its own data.
+"""
+import bisect
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bigtable_client import decode_cursor, encode_cursor
+from cache import principal_cache
+from ids import next_id
+from metrics import instrumented
+from .bigtable_chat import message_row_key, message_row_prefix, user_chat_index_key, user_chat_index_prefix
+from .bigtable_usage import USAGE_COUNTERS, usage_row_key
+from .bigtable_user import email_lookup_key, google_id_lookup_key
+from .chat import Chat, ChatMessage, ChatMessageCreate
+from .usage import DailyUsageSchema, TokenUsage
+from .user import User
+
+
+class SortedKeys:
+    """Sorted row keys under one prefix, paged like a Bigtable row range"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.keys: List[str] = []
+
+    def add(self, key: str):
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            self.keys.insert(index, key)
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        start = 0
+        if cursor is not None:
+            start = bisect.bisect_right(self.keys, decode_cursor(cursor, self.prefix))
+        keys = self.keys[start:start + limit]
+        if start + limit >= len(self.keys):
+            return keys, None
+        return keys, encode_cursor(keys[-1].encode("utf-8"))
+
+
+class MemoryStore:
+    """The process-wide tables, with the same secondary indexes as the Bigtable layout"""
+
+    def __init__(self):
+        self.users: Dict[int, User] = {}
+        # gid#/email# lookup key -> user id
+        self.user_lookups: Dict[str, int] = {}
+        self.chats: Dict[str, Chat] = {}
+        # Per-user chat index, newest first, and index key -> chat id
+        self.chat_index: Dict[int, SortedKeys] = {}
+        self.chat_index_ids: Dict[str, str] = {}
+        # Per-user chat list version, bumped when a chat is added or renamed
+        self.chat_list_versions: Dict[int, int] = {}
+        # Per-chat message keys, oldest first, and message key -> message
+        self.message_keys: Dict[str, SortedKeys] = {}
+        self.messages: Dict[str, ChatMessage] = {}
+        self.usage: Dict[str, TokenUsage] = {}
+        # Services are also driven from the sync facades' loop thread
+        self.lock = threading.Lock()
+
+
+memory_store = MemoryStore()
+
+
+@instrumented("chat")
+class MemoryChatService:
+    """Chat service over the in-memory store; see AsyncBigtableChatService"""
+
+    def __init__(self, store: MemoryStore = memory_store):
+        self.store = store
+
+    async def create_chat(self, title: str, user_id: int, chat_id: str = None) -> Chat:
+        """Create a new chat with optional client-provided ID, or return the existing one"""
+        if chat_id is None:
+            chat_id = str(uuid.uuid4())  # like the client's ids, so chat keys never cluster
+
+        now = datetime.utcnow()
+        chat = Chat(id=chat_id, title=title, user_id=user_id, created_at=now, updated_at=now)
+        index_key = user_chat_index_key(user_id, now, chat_id)
+        with self.store.lock:
+            if chat_id in self.store.chats:
+                return self.store.chats[chat_id].model_copy()
+            self.store.chats[chat_id] = chat
+            self.store.chat_index.setdefault(user_id, SortedKeys(user_chat_index_prefix(user_id))).add(index_key)
+            self.store.chat_index_ids[index_key] = chat_id
+            self._bump_chat_list_version(user_id)
+        return chat.model_copy()
+
+    async def get_chat_by_id(self, chat_id: str) -> Optional[Chat]:
+        """Get chat by ID"""
+        chat = self.store.chats.get(chat_id)
+        return chat.model_copy() if chat else None
+
+    async def get_chats_by_user_id(self, user_id: int, limit: Optional[int] = None) -> List[Chat]:
+        """Get a user's chats, newest first"""
+        index = self.store.chat_index.get(user_id)
+        keys = index.keys[:limit] if index else []
+        return [self.store.chats[self.store.chat_index_ids[key]].model_copy() for key in keys]
+
+    async def get_chats_page(self, user_id: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[Chat], Optional[str]]:
+        """Get one page of a user's chats, newest first, and the cursor for the next page.
+
+        Raises ValueError for a cursor that wasn't issued for this user.
+        """
+        index = self.store.chat_index.get(user_id, SortedKeys(user_chat_index_prefix(user_id)))
+        keys, next_cursor = index.page(limit, cursor)
+        return [self.store.chats[self.store.chat_index_ids[key]].model_copy() for key in keys], next_cursor
+
+    async def update_chat(self, chat_id: str, title: Optional[str] = None) -> Optional[Chat]:
+        """Update chat information"""
+        with self.store.lock:
+            chat = self.store.chats.get(chat_id)
+            if chat is None:
+                return None
+            update = {"updated_at": datetime.utcnow()}
+            if title is not None:
+                update["title"] = title
+                self._bump_chat_list_version(chat.user_id)
+            chat = self.store.chats[chat_id] = chat.model_copy(update=update)
+        return chat.model_copy()
+
+    def _bump_chat_list_version(self, user_id: int):
+        # Called with the store lock held
+        self.store.chat_list_versions[user_id] = self.store.chat_list_versions.get(user_id, 0) + 1
+
+    async def get_chat_list_version(self, user_id: int) -> Optional[int]:
+        """Version of the user's chat list, or None if it has never changed"""
+        return self.store.chat_list_versions.get(user_id)
+
+    async def create_message(self, chat_id: str, user_id: int, message_type: str, content: str,
+                      tokens_used: Optional[int] = None, model: Optional[str] = None,
+                      truncated: bool = False, usage: Optional[TokenUsage] = None,
+                      previous_updated_at: Optional[datetime] = None) -> ChatMessage:
+        """Create a new chat message; see AsyncBigtableChatService.create_message"""
+        token_fields = {"tokens_used": tokens_used}
+        if usage is not None:
+            token_fields = {
+                "tokens_used": usage.total_tokens,
+                "input_tokens": usage.input_tokens,
+                "output_tokens": usage.output_tokens,
+                "cache_read_input_tokens": usage.cache_read_input_tokens,
+                "cache_creation_input_tokens": usage.cache_creation_input_tokens,
+            }
+        messages = await self.create_messages([ChatMessageCreate(
+            chat_id=chat_id,
+            user_id=user_id,
+            message_type=message_type,
+            content=content,
+            model=model,
+            truncated=truncated,
+            **token_fields,
+        )], {chat_id: previous_updated_at})
+        return messages[0]
+
+    async def create_messages(self, messages: List[ChatMessageCreate],
+                              previous_updated_at: Optional[Dict[str, Optional[datetime]]] = None) -> List[ChatMessage]:
+        """Create several messages and bump their chats' updated_at"""
+        created_at = datetime.utcnow()
+
+        created = [
+            ChatMessage(id=next_id(), created_at=created_at, **message.model_dump())
+            for message in messages
+        ]
+        with self.store.lock:
+            for message in created:
+                key = message_row_key(message.chat_id, message.id)
+                self.store.messages[key] = message
+                self.store.message_keys.setdefault(
+                    message.chat_id, SortedKeys(message_row_prefix(message.chat_id))
+                ).add(key)
+                chat = self.store.chats.get(message.chat_id)
+                if chat is not None:
+                    self.store.chats[message.chat_id] = chat.model_copy(update={"updated_at": created_at})
+        return created
+
+    async def get_conversation_history(self, chat: Chat) -> List[ChatMessage]:
+        """Get a chat's messages in chronological order"""
+        return await self.get_messages_by_chat_id(chat.id)
+
+    async def get_messages_by_chat_id(self, chat_id: str) -> List[ChatMessage]:
+        """Get all messages for a chat in chronological order"""
+        index = self.store.message_keys.get(chat_id)
+        return [self.store.messages[key] for key in index.keys] if index else []
+
+    async def get_messages_page(self, chat_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[ChatMessage], Optional[str]]:
+        """Get one page of a chat's messages, oldest first, and the cursor for the next page.
+
+        Raises ValueError for a cursor that wasn't issued for this chat.
+        """
+        index = self.store.message_keys.get(chat_id, SortedKeys(message_row_prefix(chat_id)))
+        keys, next_cursor = index.page(limit, cursor)
+        return [self.store.messages[key] for key in keys], next_cursor
+
+
+@instrumented("user")
+class MemoryUserService:
+    """User service over the in-memory store; see AsyncBigtableUserService"""
+
+    def __init__(self, store: MemoryStore = memory_store):
+        self.store = store
+
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+        """Get user by ID"""
+        user = self.store.users.get(user_id)
+        return user.model_copy() if user else None
+
+    async def get_user_by_google_id(self, google_id: str) -> Optional[User]:
+        """Get user by Google ID"""
+        user_id = self.store.user_lookups.get(google_id_lookup_key(google_id))
+        return await self.get_user_by_id(user_id) if user_id is not None else None
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get user by email"""
+        user_id = self.store.user_lookups.get(email_lookup_key(email))
+        return await self.get_user_by_id(user_id) if user_id is not None else None
+
+    async def create_user(
+        self, name: str, email: str, google_id: str, picture: Optional[str] = None
+    ) -> User:
+        """Create a new user, or return the existing one if a concurrent login won"""
+        now = datetime.utcnow()
+        with self.store.lock:
+            # Claiming the google_id lookup decides the winner, as in Bigtable
+            winner_id = self.store.user_lookups.get(google_id_lookup_key(google_id))
+            if winner_id is not None:
+                return self.store.users[winner_id].model_copy()
+
+            user_id = next_id()
+            user = User(
+                id=user_id, name=name or "", email=email or "", google_id=google_id or "",
+                picture=picture, created_at=now, updated_at=now,
+            )
+            self.store.users[user_id] = user
+            self.store.user_lookups[google_id_lookup_key(google_id)] = user_id
+            if email_lookup_key(email) in self.store.user_lookups:
+                print(f"Email for user {user_id} is already claimed by another user")
+            else:
+                self.store.user_lookups[email_lookup_key(email)] = user_id
+
+        principal_cache.invalidate_user(user_id)
+        return user.model_copy()
+
+    async def update_user(
+        self, user_id: int, name: Optional[str] = None, picture: Optional[str] = None
+    ) -> Optional[User]:
+        """Update user information"""
+        with self.store.lock:
+            user = self.store.users.get(user_id)
+            if user is None:
+                return None
+            update = {"updated_at": datetime.utcnow()}
+            if name is not None:
+                update["name"] = name
+            if picture is not None:
+                update["picture"] = picture
+            user = self.store.users[user_id] = user.model_copy(update=update)
+
+        principal_cache.invalidate_user(user_id)
+        return user.model_copy()
+
+
+@instrumented("usage")
+class MemoryUsageService:
+    """Usage counters over the in-memory store; see AsyncBigtableUsageService"""
+
+    def __init__(self, store: MemoryStore = memory_store):
+        self.store = store
+
+    async def record_usage(self, user_id: int, usage: TokenUsage, day: Optional[date] = None):
+        """Add one reply's token counts to the user's counters for the (UTC) day"""
+        key = usage_row_key(user_id, day or datetime.utcnow().date())
+        with self.store.lock:
+            counters = self.store.usage.setdefault(key, TokenUsage())
+            for name in USAGE_COUNTERS:
+                setattr(counters, name, getattr(counters, name) + getattr(usage, name))
+
+    async def get_daily_usage(self, user_id: int, start: date, end: date) -> List[DailyUsageSchema]:
+        """Get the user's usage for each day from start to end inclusive that has any"""
+        days = []
+        for offset in range((end - start).days + 1):
+            day = start + timedelta(days=offset)
+            counters = self.store.usage.get(usage_row_key(user_id, day))
+            if counters is not None:
+                days.append(DailyUsageSchema(day=day, **counters.model_dump()))
+        return days
@@ -0,0 +1,114 @@
+"""Storage backends and the interface the request handlers use.
+
+STORAGE_BACKEND selects the implementation:
+
+- bigtable (default): Cloud Bigtable, configured by GOOGLE_CLOUD_PROJECT
+  and friends.
+- emulator: the same Bigtable services against the Bigtable emulator at
+  BIGTABLE_EMULATOR_HOST (default localhost:8086).
+- memory: process-local, indexed in-memory tables with the same
+  semantics, for load tests and profiling without GCP.
+"""
+import os
+from datetime import date, datetime
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from bigtable_client import close_async_tables, ensure_table_exists, get_async_table
+from .bigtable_chat import AsyncBigtableChatService
+from .bigtable_usage import AsyncBigtableUsageService
+from .bigtable_user import AsyncBigtableUserService
+from .chat import Chat, ChatMessage, ChatMessageCreate
+from .memory import MemoryChatService, MemoryUsageService, MemoryUserService
+from .usage import DailyUsageSchema, TokenUsage
+from .user import User
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "bigtable")
+STORAGE_BACKENDS = ("bigtable", "emulator", "memory")
+BIGTABLE_EMULATOR_DEFAULT_HOST = "localhost:8086"
+
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(STORAGE_BACKENDS)}")
+if STORAGE_BACKEND == "emulator":
+    # Read by the Bigtable clients when they are created
+    os.environ.setdefault("BIGTABLE_EMULATOR_HOST", BIGTABLE_EMULATOR_DEFAULT_HOST)
+
+
+class ChatStore(Protocol):
+    async def create_chat(self, title: str, user_id: int, chat_id: str = None) -> Chat: ...
+
+    async def get_chat_by_id(self, chat_id: str) -> Optional[Chat]: ...
+
+    async def get_chats_by_user_id(self, user_id: int, limit: Optional[int] = None) -> List[Chat]: ...
+
+    async def get_chats_page(self, user_id: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[Chat], Optional[str]]: ...
+
+    async def update_chat(self, chat_id: str, title: Optional[str] = None) -> Optional[Chat]: ...
+
+    async def get_chat_list_version(self, user_id: int) -> Optional[int]: ...
+
+    async def create_message(self, chat_id: str, user_id: int, message_type: str, content: str,
+                             tokens_used: Optional[int] = None, model: Optional[str] = None,
+                             truncated: bool = False, usage: Optional[TokenUsage] = None,
+                             previous_updated_at: Optional[datetime] = None) -> ChatMessage: ...
+
+    async def create_messages(self, messages: List[ChatMessageCreate],
+                              previous_updated_at: Optional[Dict[str, Optional[datetime]]] = None) -> List[ChatMessage]: ...
+
+    async def get_conversation_history(self, chat: Chat) -> List[ChatMessage]: ...
+
+    async def get_messages_by_chat_id(self, chat_id: str) -> List[ChatMessage]: ...
+
+    async def get_messages_page(self, chat_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[ChatMessage], Optional[str]]: ...
+
+
+class UserStore(Protocol):
+    async def get_user_by_id(self, user_id: int) -> Optional[User]: ...
+
+    async def get_user_by_google_id(self, google_id: str) -> Optional[User]: ...
+
+    async def get_user_by_email(self, email: str) -> Optional[User]: ...
+
+    async def create_user(self, name: str, email: str, google_id: str, picture: Optional[str] = None) -> User: ...
+
+    async def update_user(self, user_id: int, name: Optional[str] = None, picture: Optional[str] = None) -> Optional[User]: ...
+
+
+class UsageStore(Protocol):
+    async def record_usage(self, user_id: int, usage: TokenUsage, day: Optional[date] = None): ...
+
+    async def get_daily_usage(self, user_id: int, start: date, end: date) -> List[DailyUsageSchema]: ...
+
+
+def uses_bigtable() -> bool:
+    return STORAGE_BACKEND != "memory"
+
+
+def chat_store() -> ChatStore:
+    if uses_bigtable():
+        return AsyncBigtableChatService()
+    return MemoryChatService()
+
+
+def user_store() -> UserStore:
+    if uses_bigtable():
+        return AsyncBigtableUserService()
+    return MemoryUserService()
+
+
+def usage_store() -> UsageStore:
+    if uses_bigtable():
+        return AsyncBigtableUsageService()
+    return MemoryUsageService()
+
+
+async def open_storage():
+    """Prepare the configured backend at startup"""
+    if uses_bigtable():
+        await ensure_table_exists()
+        # Open the Bigtable channel pool up front rather than on the first request
+        get_async_table()
+
+
+async def close_storage():
+    if uses_bigtable():
+        await close_async_tables()
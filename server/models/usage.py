@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import List
+from datetime import date
+
+class TokenUsage(BaseModel):
+    """Token counts for one model reply, or a sum of them"""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    replies: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens + self.cache_read_input_tokens + self.cache_creation_input_tokens
+
+class DailyUsageSchema(TokenUsage):
+    day: date
+
+class UsageSchema(BaseModel):
+    """A user's token usage per UTC day over a date range, and its total"""
+    days: List[DailyUsageSchema]
+    total: TokenUsage
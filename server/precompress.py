@@ -0,0 +1,64 @@
+"""Write brotli and gzip variants of the built client for spa.py to serve.
+
+Run after building the client (from the server/ directory):
+
+    uv run python precompress.py ../client/dist
+
+Each compressible file gets name.br and name.gz next to it, at maximum
+quality since this runs once per build, not per request. Variants that
+aren't smaller than the original are removed rather than written.
+"""
+import argparse
+import gzip
+import os
+
+import brotli
+
+COMPRESSIBLE_EXTENSIONS = (".html", ".js", ".mjs", ".css", ".svg", ".json", ".map", ".txt", ".xml", ".wasm")
+# Below this, the saving doesn't cover the extra response headers
+MIN_COMPRESS_BYTES = 256
+
+
+def compressed_variants(data: bytes):
+    yield ".br", brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical across builds of the same file
+    yield ".gz", gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory: str) -> dict:
+    """Write variants for every compressible file under directory; returns byte totals"""
+    totals = {"files": 0, "bytes": 0, ".br": 0, ".gz": 0}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            totals["files"] += 1
+            totals["bytes"] += len(data)
+            for suffix, compressed in compressed_variants(data):
+                if len(data) >= MIN_COMPRESS_BYTES and len(compressed) < len(data):
+                    with open(path + suffix, "wb") as f:
+                        f.write(compressed)
+                    totals[suffix] += len(compressed)
+                else:
+                    totals[suffix] += len(data)
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=os.path.join("..", "client", "dist"))
+    args = parser.parse_args()
+    totals = precompress(args.directory)
+    print(
+        f"{totals['files']} files, {totals['bytes']} bytes: "
+        f"{totals['.br']} as brotli, {totals['.gz']} as gzip"
+    )
+
+
+if __name__ == "__main__":
+    main()
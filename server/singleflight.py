@@ -0,0 +1,71 @@
+"""Single-flight coalescing of concurrent, identical storage reads.
+
+A read decorated with @coalesced(flight) runs as one shared task per key
+(the method name and its arguments): callers that arrive while it is in
+flight await the same task instead of issuing their own RPC, which is what
+several tabs opening or polling the same chat at once would otherwise do.
+Nothing is kept once the task finishes, so this is not a cache.
+
+Writes call flight.forget(...) for the keys they change, so a read that
+starts after a write never joins a read that started before it. Every
+caller of a key gets the same result object, which must be treated as
+read-only.
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """In-flight reads by key, with counts of calls and the RPCs they saved"""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[Tuple, asyncio.Task] = {}
+
+    async def do(self, key: Tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn(), or the identical call already in flight for key"""
+        self.calls += 1
+        task = self._flights.get(key)
+        # Sync facades run their own event loop, whose tasks can't be awaited here
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(functools.partial(self._landed, key))
+        else:
+            self.coalesced += 1
+        # A cancelled caller leaves the read running for the others
+        return await asyncio.shield(task)
+
+    def forget(self, *prefix):
+        """Stop new callers joining reads whose key starts with prefix; they start fresh ones"""
+        for key in [key for key in self._flights if key[:len(prefix)] == prefix]:
+            del self._flights[key]
+
+    def _landed(self, key: Tuple, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # Retrieved here so a failure whose callers all went away isn't logged as unhandled
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), "calls": self.calls, "coalesced": self.coalesced}
+
+
+def coalesced(flight: SingleFlight):
+    """Method decorator sharing concurrent identical calls through flight"""
+    def decorate(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        async def call(self, *args, **kwargs):
+            key = (name, *args, *sorted(kwargs.items()))
+            return await flight.do(key, lambda: method(self, *args, **kwargs))
+        return call
+    return decorate
+
+
+chat_reads = SingleFlight()
+user_reads = SingleFlight()
@@ -0,0 +1,138 @@
+"""Serving the built client (client/dist) from the app itself.
+
+Set CLIENT_DIST_DIR to the Vite build output to serve it at / with the API
+under /api, the same layout the Vite dev server proxies. Files are indexed
+once at startup:
+
+- Precompressed variants written next to a file by precompress.py
+  (name.br, name.gz) are sent instead of it when the request's
+  Accept-Encoding allows, so nothing is compressed per request.
+- Vite's content-hashed output under assets/ is cached by browsers for a
+  year as immutable; everything else (index.html above all) is revalidated
+  on each use, which the ETags make a cheap 304.
+- Browser navigations to paths that aren't files get index.html, so client
+  routes like /chats/:id load the app.
+
+Bodies are sent by starlette's FileResponse, which hands the server just
+the path (http.response.pathsend) where it supports that, for a zero-copy
+sendfile, and streams the file in chunks otherwise.
+"""
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from etags import REVALIDATE_CACHE_CONTROL, etag_matches
+
+CLIENT_DIST_DIR = os.getenv("CLIENT_DIST_DIR")
+# Vite puts content-hashed bundles here, so a name never changes content
+HASHED_ASSETS_PREFIX = "assets/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Preferred first
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+@dataclass
+class StaticFile:
+    path: str
+    media_type: str
+    etag: str
+    cache_control: str
+    # Content-Encoding -> path of the precompressed variant
+    variants: Dict[str, str]
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings named in an Accept-Encoding header, minus any refused with q=0"""
+    codings = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        codings.add(coding.strip().lower())
+    return codings
+
+
+class SpaFiles:
+    """ASGI app serving a built single-page app with precompressed variants and ETags"""
+
+    def __init__(self, directory: str, index: str = "index.html"):
+        self.directory = os.path.realpath(directory)
+        self.files: Dict[str, StaticFile] = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                url_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                if not url_path.endswith(tuple(suffix for _, suffix in PRECOMPRESSED_ENCODINGS)):
+                    self.files[url_path] = self._index_file(url_path, path)
+        self.index = self.files.get(index)
+        if self.index is None:
+            raise RuntimeError(f"{index} not found in {self.directory}; build the client first")
+
+    @staticmethod
+    def _index_file(url_path: str, path: str) -> StaticFile:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:32]
+        modified = os.stat(path).st_mtime
+        variants = {}
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            # A variant older than its file is left over from a previous build
+            if os.path.exists(path + suffix) and os.stat(path + suffix).st_mtime >= modified:
+                variants[encoding] = path + suffix
+        return StaticFile(
+            path=path,
+            media_type=mimetypes.guess_type(url_path)[0] or "application/octet-stream",
+            etag=f'"{digest}"',
+            cache_control=IMMUTABLE_CACHE_CONTROL if url_path.startswith(HASHED_ASSETS_PREFIX) else REVALIDATE_CACHE_CONTROL,
+            variants=variants,
+        )
+
+    def lookup(self, request: Request) -> Optional[StaticFile]:
+        url_path = request.url.path.lstrip("/")
+        static_file = self.files.get(url_path or "index.html")
+        if static_file is not None:
+            return static_file
+        # Client-side routes: page loads of extension-less paths, not missing assets or API calls
+        last_segment = url_path.rsplit("/", 1)[-1]
+        if "." not in last_segment and "text/html" in request.headers.get("accept", ""):
+            return self.index
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        request = Request(scope)
+        response = self.response(request)
+        await response(scope, receive, send)
+
+    def response(self, request: Request) -> Response:
+        if request.method not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        static_file = self.lookup(request)
+        if static_file is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        encoding = None
+        if static_file.variants:
+            accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+            encoding = next((e for e, _ in PRECOMPRESSED_ENCODINGS if e in accepted and e in static_file.variants), None)
+
+        # Each encoding is a different representation, so it gets its own validator
+        etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+        headers = {"ETag": etag, "Cache-Control": static_file.cache_control}
+        if static_file.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return FileResponse(
+            static_file.variants.get(encoding, static_file.path),
+            headers=headers,
+            media_type=static_file.media_type,
+        )
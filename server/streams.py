@@ -0,0 +1,243 @@
+"""In-memory replay buffers for assistant reply streams.
+
+Each reply is generated by a background task that appends numbered NDJSON
+frames to a ReplyStream, independently of any client connection. Clients
+read the stream from a sequence number, so one whose connection drops can
+reattach with GET /chats/{chat_id}/stream?after=N and pick up where it left
+off instead of asking for a new generation.
+
+A reply nobody is reading any more is abandoned: once its last reader has
+been gone for STREAM_ABANDON_GRACE_SECONDS (long enough for a client to
+reattach after a dropped connection), the producer task is cancelled,
+which closes the upstream model stream.
+
+Model text deltas are coalesced into content frames: the first is sent at
+once, so time to first token is unchanged, and later ones are held for up
+to STREAM_COALESCE_MS or until STREAM_COALESCE_CHARS have collected. That
+turns a reply's hundreds of tiny frames (each a JSON encode, a socket write
+and a client re-render) into a few dozen. Any other frame flushes pending
+text first, so frame order is preserved.
+
+Buffers live in the worker process that generates the reply, so reattaching
+needs the same session affinity as the original request.
+"""
+import asyncio
+import itertools
+import os
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+import orjson
+
+from metrics import replies_in_flight, reply_readers
+
+# Frames kept per stream; a reply of MAX_TOKENS deltas fits with room to spare
+STREAM_BUFFER_FRAMES = int(os.getenv("STREAM_BUFFER_FRAMES", "4096"))
+# How long a finished stream stays available for late reattaches
+STREAM_RETENTION_SECONDS = float(os.getenv("STREAM_RETENTION_SECONDS", "60"))
+# How long a reply may go without readers before its generation is cancelled
+STREAM_ABANDON_GRACE_SECONDS = float(os.getenv("STREAM_ABANDON_GRACE_SECONDS", "10"))
+# Window for combining text deltas into one content frame; 0 sends every delta as its own frame
+STREAM_COALESCE_SECONDS = float(os.getenv("STREAM_COALESCE_MS", "15")) / 1000
+STREAM_COALESCE_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", "512"))
+
+
+def encode_frame(frame: dict) -> bytes:
+    """One NDJSON line"""
+    return orjson.dumps(frame) + b"\n"
+
+
+class ReplyStream:
+    """Bounded ring buffer of one reply's frames, numbered from 1"""
+
+    def __init__(
+        self,
+        chat_id: str,
+        user_id: int,
+        max_frames: int = STREAM_BUFFER_FRAMES,
+        on_idle: Optional[Callable[["ReplyStream"], None]] = None,
+        coalesce_seconds: float = STREAM_COALESCE_SECONDS,
+        coalesce_chars: int = STREAM_COALESCE_CHARS,
+    ):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.done = False
+        self.last_seq = 0
+        self.readers = 0
+        # The task producing this reply, and a hook called whenever the last reader detaches
+        self.task: Optional[asyncio.Task] = None
+        self.idle_checks = 0
+        self._on_idle = on_idle
+        self._frames: deque = deque(maxlen=max_frames)
+        self._changed = asyncio.Event()
+        self.coalesce_seconds = coalesce_seconds
+        self.coalesce_chars = coalesce_chars
+        # Text deltas not yet sent, and the timer that will send them
+        self._pending_text: List[str] = []
+        self._pending_chars = 0
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._sent_text = False
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest frame still buffered"""
+        return self.last_seq - len(self._frames) + 1
+
+    def can_resume(self, after: int) -> bool:
+        return after + 1 >= self.first_seq
+
+    def append(self, frame: dict):
+        self.flush_text()
+        self._append(frame)
+
+    def _append(self, frame: dict):
+        self.last_seq += 1
+        frame["seq"] = self.last_seq
+        self._frames.append(encode_frame(frame))
+        self._notify()
+
+    def append_text(self, text: str):
+        """Add a model text delta, sent in a content frame with any that follow within the window"""
+        if not self._sent_text or self.coalesce_seconds <= 0:
+            # The first token goes out at once
+            self._sent_text = True
+            self._append({"content": text, "type": "content"})
+            return
+
+        self._pending_text.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= self.coalesce_chars:
+            self.flush_text()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(self.coalesce_seconds, self.flush_text)
+
+    def flush_text(self):
+        """Send pending text deltas now"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._pending_text:
+            content = "".join(self._pending_text)
+            self._pending_text.clear()
+            self._pending_chars = 0
+            self._append({"content": content, "type": "content"})
+
+    def finish(self):
+        self.flush_text()
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def frames(self, after: int = 0) -> AsyncIterator[bytes]:
+        """Yield every frame numbered above `after`, following the stream until it finishes"""
+        self.readers += 1
+        reply_readers.inc()
+        try:
+            while True:
+                changed = self._changed
+                if not self.can_resume(after):
+                    # The reader fell further behind than the buffer reaches
+                    yield encode_frame({"type": "error", "detail": "Stream buffer overrun"})
+                    return
+
+                pending = list(itertools.islice(self._frames, after + 1 - self.first_seq, None))
+                if pending:
+                    # Everything buffered goes out as one write
+                    yield b"".join(pending)
+                after += len(pending)
+
+                if self.done and after >= self.last_seq:
+                    return
+                if not pending:
+                    await changed.wait()
+        finally:
+            # Runs when the response ends or is cancelled by a disconnect
+            self.readers -= 1
+            reply_readers.dec()
+            if not self.readers and self._on_idle:
+                self._on_idle(self)
+
+
+class ReplyStreamRegistry:
+    """Active and recently finished reply streams in this process, one per chat"""
+
+    def __init__(
+        self,
+        retention_seconds: float = STREAM_RETENTION_SECONDS,
+        abandon_grace_seconds: float = STREAM_ABANDON_GRACE_SECONDS,
+    ):
+        self.retention_seconds = retention_seconds
+        self.abandon_grace_seconds = abandon_grace_seconds
+        self._streams: Dict[str, ReplyStream] = {}
+        # Strong references so running producers aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+        # Replies cancelled for lack of readers, with the text deltas they had
+        # streamed and the seconds they had run when cancelled
+        self.abandoned = 0
+        self.abandoned_output_deltas = 0
+        self.abandoned_seconds = 0.0
+
+    def get(self, chat_id: str) -> Optional[ReplyStream]:
+        return self._streams.get(chat_id)
+
+    def is_generating(self, chat_id: str) -> bool:
+        stream = self._streams.get(chat_id)
+        return stream is not None and not stream.done
+
+    def start(self, chat_id: str, user_id: int, produce: Callable[[ReplyStream], Awaitable[None]]) -> ReplyStream:
+        """Run produce(stream) in the background and return the stream it writes to"""
+        stream = ReplyStream(chat_id, user_id, on_idle=self._watch_idle)
+        self._streams[chat_id] = stream
+
+        async def run():
+            replies_in_flight.inc()
+            try:
+                await produce(stream)
+            except Exception as e:
+                print(f"Error generating reply for chat {chat_id}: {e}")
+                stream.append({"type": "error", "detail": "Reply generation failed"})
+            finally:
+                replies_in_flight.dec()
+                stream.finish()
+                asyncio.get_running_loop().call_later(self.retention_seconds, self._expire, stream)
+
+        stream.task = asyncio.create_task(run())
+        self._tasks.add(stream.task)
+        stream.task.add_done_callback(self._tasks.discard)
+        # Also covers a client that is gone before the response starts
+        self._watch_idle(stream)
+        return stream
+
+    def _watch_idle(self, stream: ReplyStream):
+        # Only the check scheduled by the most recent detach may cancel
+        stream.idle_checks += 1
+        asyncio.get_running_loop().call_later(
+            self.abandon_grace_seconds, self._abandon_if_idle, stream, stream.idle_checks
+        )
+
+    def _abandon_if_idle(self, stream: ReplyStream, check: int):
+        if check == stream.idle_checks and not stream.readers and not stream.done:
+            stream.task.cancel()
+
+    def record_abandoned(self, output_deltas: int, elapsed_seconds: float):
+        self.abandoned += 1
+        self.abandoned_output_deltas += output_deltas
+        self.abandoned_seconds += elapsed_seconds
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": sum(1 for stream in self._streams.values() if not stream.done),
+            "abandoned": self.abandoned,
+            "abandoned_output_deltas": self.abandoned_output_deltas,
+            "abandoned_seconds": round(self.abandoned_seconds, 3),
+        }
+
+    def _expire(self, stream: ReplyStream):
+        if self._streams.get(stream.chat_id) is stream:
+            del self._streams[stream.chat_id]
+
+
+reply_streams = ReplyStreamRegistry()